@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+from column_profile import profile_frame
+from downsample import MinMaxAccumulator, ReservoirSample, minmax_downsample
+from instrument import span
+
+
+class ColumnAggregates:
+    # Per-DataFrame memo of column statistics shared by the chart, PDF and map
+    # stages. Build a new one whenever a new sheet is loaded.
+    def __init__(self, df):
+        self.df = df
+        self._value_counts = {}
+        self._profiles = None
+        self._matches = {}
+
+    @property
+    def rows(self):
+        return len(self.df)
+
+    def has_column(self, column):
+        return column in self.df.columns
+
+    def line_points(self, column):
+        return minmax_downsample(self.df.index.to_numpy(), self.df[column].to_numpy())
+
+    def scatter_points(self, x_column, y_column):
+        return self.df[x_column].to_numpy(), self.df[y_column].to_numpy()
+
+    def value_counts(self, column):
+        if column not in self._value_counts:
+            with span("aggregate", column=column):
+                self._value_counts[column] = self.df[column].value_counts()
+        return self._value_counts[column]
+
+    def total(self, column):
+        return int(self.value_counts(column).sum())
+
+    def percentages(self, column):
+        total = self.total(column)
+        value_counts = self.value_counts(column)
+        return value_counts / total * 100 if total else value_counts * 0.0
+
+    def profiles(self):
+        # One profiling pass over the whole sheet, see column_profile.
+        if self._profiles is None:
+            with span("profile", columns=len(self.df.columns)):
+                self._profiles = profile_frame(self.df)
+        return self._profiles
+
+    def profile(self, column):
+        return self.profiles()[column]
+
+    def is_numeric(self, column):
+        return self.profile(column)["numeric"]
+
+    def numeric_columns(self, columns):
+        return [column for column in columns if self.has_column(column) and self.is_numeric(column)]
+
+    def matching_values(self, column, text):
+        # Distinct values of the column whose lowercased text contains `text`.
+        key = (column, text)
+        if key not in self._matches:
+            values = self.value_counts(column).index.to_series()
+            if pd.api.types.is_datetime64_any_dtype(values):
+                labels = values.map(str)
+            else:
+                labels = values.astype(str)
+            self._matches[key] = values[labels.str.lower().str.contains(text, regex=False).to_numpy()].tolist()
+        return self._matches[key]
+
+
+class StreamingAggregates(ColumnAggregates):
+    # The same statistics built chunk by chunk with update(), for sheets too
+    # large to load. Only what the job asks for is kept: value counts for the
+    # Pie/Bar columns, a min/max line for the Line columns and a bounded row
+    # sample for Scatter plots, so memory does not grow with the row count.
+    def __init__(self, columns, count_columns=(), line_columns=(), sample_columns=(), sample_size=50000, rows=None):
+        super().__init__(None)
+        self.columns = list(columns)
+        self._rows = 0
+        self._counters = {column: {} for column in count_columns}
+        self._lines = {column: MinMaxAccumulator(rows=rows) for column in line_columns}
+        self._sample = ReservoirSample(sample_size, sample_columns) if sample_columns else None
+        self._summaries = {column: {"dtype": None, "numeric": True, "nulls": 0, "min": None, "max": None} for column in self.columns}
+
+    def update(self, chunk):
+        with span("aggregate_chunk", rows=len(chunk)):
+            self._rows += len(chunk)
+            for column in self.columns:
+                series = chunk[column]
+                summary = self._summaries[column]
+                nulls = int(series.isna().sum())
+                summary["nulls"] += nulls
+                numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+                if summary["dtype"] is None or nulls < len(series):
+                    summary["dtype"] = str(series.dtype)
+                summary["numeric"] = summary["numeric"] and numeric
+                if summary["numeric"] and nulls < len(series):
+                    values = series.to_numpy(dtype=float, na_value=np.nan)
+                    low, high = float(np.nanmin(values)), float(np.nanmax(values))
+                    summary["min"] = low if summary["min"] is None else min(summary["min"], low)
+                    summary["max"] = high if summary["max"] is None else max(summary["max"], high)
+                if column in self._counters:
+                    # sort=False keeps first appearance order, as value_counts
+                    # breaks ties on the whole column.
+                    counter = self._counters[column]
+                    for value, count in series.value_counts(sort=False).items():
+                        counter[value] = counter.get(value, 0) + int(count)
+                if column in self._lines and summary["numeric"]:
+                    self._lines[column].add(series.to_numpy(dtype=float, na_value=np.nan))
+            if self._sample is not None:
+                numeric_columns = [column for column in self._sample.columns if self._summaries[column]["numeric"]]
+                values = np.full((len(chunk), len(self._sample.columns)), np.nan)
+                for position, column in enumerate(self._sample.columns):
+                    if column in numeric_columns:
+                        values[:, position] = chunk[column].to_numpy(dtype=float, na_value=np.nan)
+                self._sample.add(values)
+        self._profiles = None
+
+    @property
+    def rows(self):
+        return self._rows
+
+    def has_column(self, column):
+        return column in self._summaries
+
+    def line_points(self, column):
+        return self._lines[column].result()
+
+    def scatter_points(self, x_column, y_column):
+        return self._sample.column(x_column), self._sample.column(y_column)
+
+    def value_counts(self, column):
+        if column not in self._value_counts:
+            counter = self._counters[column]
+            counts = pd.Series(list(counter.values()), index=pd.Index(list(counter.keys()), name=column), name="count", dtype=np.int64)
+            self._value_counts[column] = counts.sort_values(ascending=False, kind="stable")
+        return self._value_counts[column]
+
+    def profiles(self):
+        if self._profiles is None:
+            self._profiles = {column: self._profile(column, summary) for column, summary in self._summaries.items()}
+        return self._profiles
+
+    def _profile(self, column, summary):
+        info = {
+            "dtype": summary["dtype"],
+            "numeric": summary["numeric"],
+            "rows": self._rows,
+            "null_ratio": summary["nulls"] / self._rows if self._rows else 0.0,
+            "distinct": len(self._counters[column]) if column in self._counters else None,
+            "min": summary["min"] if summary["numeric"] else None,
+            "max": summary["max"] if summary["numeric"] else None,
+            "latitude_range": False,
+            "longitude_range": False,
+            "sampled": False,
+        }
+        if info["min"] is not None:
+            info["latitude_range"] = -90 <= info["min"] and info["max"] <= 90
+            info["longitude_range"] = -180 <= info["min"] and info["max"] <= 180
+        return info
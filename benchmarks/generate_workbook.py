@@ -0,0 +1,66 @@
+import argparse
+import os
+
+import numpy as np
+from openpyxl import Workbook
+
+STATUSES = ['éligible', 'Non éligible', 'éligible sur étude', 'En cours de déploiement', 'Non renseigné']
+SHAPES = {"narrow": 0, "wide": 200}
+# Metropolitan France, where the real exports are located.
+LAT_RANGE = (42.3, 51.1)
+LON_RANGE = (-4.8, 8.2)
+
+
+def synthetic_columns(rows, shape="narrow", seed=0):
+    rng = np.random.default_rng(seed)
+    columns = {
+        "ID": np.arange(1, rows + 1),
+        "FTTO": rng.choice(STATUSES, rows, p=[0.45, 0.25, 0.1, 0.1, 0.1]),
+        "FTTH - Statut": rng.choice(STATUSES, rows),
+        "Débit": rng.integers(10, 10000, rows),
+        "Latitude": np.round(rng.uniform(*LAT_RANGE, rows), 6),
+        "Longitude": np.round(rng.uniform(*LON_RANGE, rows), 6),
+    }
+    for i in range(SHAPES[shape]):
+        if i % 2:
+            columns[f"Mesure {i}"] = np.round(rng.normal(100, 15, rows), 2)
+        else:
+            columns[f"Catégorie {i}"] = rng.choice(STATUSES[:3], rows)
+    return columns
+
+def write_workbook(file_path, rows, shape="narrow", seed=0):
+    columns = synthetic_columns(rows, shape, seed)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Export")
+    sheet.append(list(columns))
+    values = [column.tolist() for column in columns.values()]
+    for row in zip(*values):
+        sheet.append(row)
+    workbook.save(file_path)
+    return file_path
+
+def workbook_path(data_folder, rows, shape, seed=0):
+    return os.path.join(data_folder, f'synthetic_{shape}_{rows}_{seed}.xlsx')
+
+def ensure_workbook(data_folder, rows, shape="narrow", seed=0):
+    # Generating the large workbooks takes minutes, keep them between runs.
+    file_path = workbook_path(data_folder, rows, shape, seed)
+    if not os.path.exists(file_path):
+        os.makedirs(data_folder, exist_ok=True)
+        write_workbook(f'{file_path}.tmp.xlsx', rows, shape, seed)
+        os.replace(f'{file_path}.tmp.xlsx', file_path)
+    return file_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Linkgraph export workbook.")
+    parser.add_argument("output", help="Path of the .xlsx file to write")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--shape", choices=sorted(SHAPES), default="narrow")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_workbook(args.output, args.rows, args.shape, args.seed)
+    print(args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+from aggregates import ColumnAggregates
+from benchmarks.generate_workbook import SHAPES, ensure_workbook
+from column_profile import detect_gps_columns
+from config import load_config
+from ingest import compact_frame, open_workbook
+from interactive_map import generate_interactive_map
+from reports import create_pdf_report, generate_charts, resolve_chart_format
+
+DEFAULT_ROWS = [10000, 100000]
+CHART_STAGES = [
+    ("FTTO", "Pie Chart", "%"),
+    ("FTTO", "Bar Chart", "Nombre"),
+    ("Débit", "Line Chart", "Nombre"),
+    ("Débit", "Scatter Plot", "Nombre"),
+]
+MAP_COLUMNS = ["FTTO", "FTTH - Statut"]
+# What engine.run_job reads for the chart and map stages below.
+LOAD_COLUMNS = list(dict.fromkeys([column for column, _, _ in CHART_STAGES] + MAP_COLUMNS + ["Latitude", "Longitude"]))
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def measure(stage, fn, memory=True):
+    # Time and peak memory come from separate runs, tracemalloc slows down
+    # allocation heavy code too much to time it at the same time.
+    start, cpu_start = time.perf_counter(), time.process_time()
+    value = fn()
+    result = {"stage": stage, "seconds": round(time.perf_counter() - start, 4),
+              "cpu_seconds": round(time.process_time() - cpu_start, 4), "peak_mb": None}
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+        finally:
+            tracemalloc.stop()
+    print(f'{stage:<32} {result["seconds"]:>9.3f}s  {result["peak_mb"] if memory else "-":>9} MB', file=sys.stderr)
+    return value, result
+
+def read_sheet(file_path, config):
+    with open_workbook(file_path, config) as reader:
+        return reader.read_sheet(0, LOAD_COLUMNS)
+
+def run_dataset(file_path, config, memory=True):
+    results = []
+    with tempfile.TemporaryDirectory() as output_folder:
+        # Same path as engine.run_job: pruned read, cold then from the ingest
+        # cache, followed by compact_frame.
+        _, result = measure("read_sheet[cold]", lambda: read_sheet(file_path, {'ingest_cache': False}), memory)
+        results.append(result)
+        cached = {'cache_folder': os.path.join(output_folder, 'cache')}
+        read_sheet(file_path, cached)
+        df, result = measure("read_sheet[warm]", lambda: read_sheet(file_path, cached), memory)
+        results.append(result)
+        df, result = measure("compact_frame", lambda: compact_frame(df, detect_gps_columns(df)), memory)
+        results.append(result)
+
+        # One ColumnAggregates for every stage, as in engine.run_job; the
+        # tracemalloc pass of a stage reuses what its timed pass computed.
+        aggregates = ColumnAggregates(df)
+        charts = []
+        chart_format = resolve_chart_format(config, pdf=True)
+        for pair in CHART_STAGES:
+            # Render in process and in memory so every run does the full work.
+            chart, result = measure(f"generate_charts[{pair[1]}]",
+                                    lambda: list(generate_charts(df, [pair], config, output_folder, workers=1, aggregates=aggregates,
+                                                                 save_png=False, chart_format=chart_format)), memory)
+            charts.extend(chart)
+            results.append(result)
+
+        _, result = measure("generate_interactive_map",
+                            lambda: generate_interactive_map(df, "Latitude", "Longitude", MAP_COLUMNS, output_folder,
+                                                             large_threshold=config.get('map_large_threshold'),
+                                                             pyramid_threshold=config.get('map_pyramid_threshold'),
+                                                             raw_zoom=config.get('map_raw_zoom'),
+                                                             aggregates=aggregates), memory)
+        results.append(result)
+
+        _, result = measure("create_pdf_report", lambda: create_pdf_report(config, charts, output_folder), memory)
+        results.append(result)
+    return results
+
+def environment():
+    return {
+        "date": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+    }
+
+def compare(results, baseline, tolerance):
+    previous = {(entry["rows"], entry["shape"], entry["stage"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        old = previous.get((entry["rows"], entry["shape"], entry["stage"]))
+        if old is None:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            if old.get(metric) and entry.get(metric) and entry[metric] > old[metric] * (1 + tolerance):
+                regressions.append({"rows": entry["rows"], "shape": entry["shape"], "stage": entry["stage"],
+                                    "metric": metric, "baseline": old[metric], "current": entry[metric]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time and measure peak memory of each Linkgraph stage on synthetic workbooks.")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="Row counts to benchmark, e.g. 10000 100000 1000000")
+    parser.add_argument("--shape", choices=sorted(SHAPES), nargs="+", default=["narrow"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-folder", default=DATA_FOLDER, help="Where generated workbooks are kept between runs")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    config = load_config()
+    if config is None:
+        sys.exit(2)
+
+    results = []
+    for shape in args.shape:
+        for rows in args.rows:
+            print(f"== {shape} {rows} rows", file=sys.stderr)
+            file_path = ensure_workbook(args.data_folder, rows, shape, args.seed)
+            for result in run_dataset(file_path, config, memory=not args.no_memory):
+                results.append(dict(result, rows=rows, shape=shape))
+
+    report = {"environment": environment(), "results": results}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as baseline_file:
+            report["regressions"] = compare(results, json.load(baseline_file), args.tolerance)
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    for regression in report.get("regressions", []):
+        print(f'Regression: {regression["stage"]} ({regression["shape"]}, {regression["rows"]} rows) '
+              f'{regression["metric"]} {regression["baseline"]} -> {regression["current"]}', file=sys.stderr)
+    sys.exit(1 if report.get("regressions") else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+# Bump when the rendering code changes the output of an unchanged job.
+RENDER_VERSION = 3
+CHART_CONFIG_KEYS = ('data_colors',)
+PDF_CONFIG_KEYS = ('color_title', 'color_text', 'logo_path')
+MANIFEST_NAME = "manifest.json"
+CHART_CACHE_MAX_MB = 500
+
+
+def _feed(digest, value):
+    # Canonical encoding: equal data always hashes the same, unlike pickle
+    # whose output depends on object identity.
+    if isinstance(value, np.ndarray):
+        digest.update(f'ndarray:{value.dtype.str}:{value.shape}:'.encode('utf-8'))
+        if value.dtype == object:
+            digest.update(json.dumps(value.tolist(), default=repr).encode('utf-8'))
+        else:
+            digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        digest.update(f'dict:{len(value)}:'.encode('utf-8'))
+        for key in sorted(value, key=str):
+            _feed(digest, key)
+            _feed(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'list:{len(value)}:'.encode('utf-8'))
+        for item in value:
+            _feed(digest, item)
+    else:
+        text = repr(value)
+        digest.update(f'{type(value).__name__}:{len(text)}:{text}'.encode('utf-8'))
+
+def _digest(payload):
+    digest = hashlib.sha256()
+    _feed(digest, payload)
+    return digest.hexdigest()
+
+def chart_key(job, config):
+    return _digest((RENDER_VERSION, job, [config.get(key) for key in CHART_CONFIG_KEYS]))
+
+def pdf_key(chart_entries, config, date):
+    return _digest((RENDER_VERSION, [(entry["column"], entry["key"]) for entry in chart_entries],
+                    [config.get(key) for key in PDF_CONFIG_KEYS], date))
+
+def default_chart_cache(config=None):
+    config = config or {}
+    if not config.get('chart_cache', True):
+        return None
+    return ChartCache(os.path.join(os.path.expanduser(config.get('cache_folder') or os.path.join("~", ".linkgraph", "cache")), "charts"),
+                      config.get('chart_cache_max_mb', CHART_CACHE_MAX_MB) * 1024 * 1024)
+
+
+class ChartCache:
+    def __init__(self, folder, max_bytes=None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._size = None
+
+    def path(self, key, chart_format='png'):
+        return os.path.join(self.folder, key[:2], f'{key}.{chart_format}')
+
+    def get(self, key, chart_format='png'):
+        path = self.path(key, chart_format)
+        try:
+            with open(path, 'rb') as chart_file:
+                image = chart_file.read()
+            # The mtime records the last use, pruning drops the oldest first.
+            os.utime(path)
+            return image
+        except OSError:
+            return None
+
+    def put(self, key, image, chart_format='png'):
+        path = self.path(key, chart_format)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f'{path}.tmp', 'wb') as chart_file:
+                chart_file.write(image)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            logging.warning("Could not store chart in cache: %s", e)
+            return
+        if self.max_bytes is None:
+            return
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += len(image)
+        if self._size > self.max_bytes:
+            self.prune()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return entries
+
+    def prune(self):
+        # Least recently used charts go first, until the cache fits max_bytes.
+        entries = sorted(self._entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+        self._size = size
+        logging.info("Chart cache pruned to %s bytes", size)
+
+
+def load_manifest(output_folder):
+    try:
+        with open(os.path.join(output_folder, MANIFEST_NAME), 'r', encoding='utf-8') as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+def update_manifest(output_folder, **sections):
+    manifest = load_manifest(output_folder)
+    manifest.update(sections)
+    manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+    with open(f'{manifest_path}.tmp', 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, ensure_ascii=False, indent=2)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+    return manifest
@@ -0,0 +1,140 @@
+import customtkinter as ctk
+from tkinter import IntVar
+
+ROW_HEIGHT = 28
+
+
+class ColumnSelection:
+    # Plain model behind the column list: names, checked columns and the
+    # current filter, independent of any widget.
+    def __init__(self, columns=()):
+        self.columns = list(columns)
+        self.checked = set()
+        self.query = ""
+        self._lowered = [str(column).lower() for column in self.columns]
+        self._visible = list(range(len(self.columns)))
+
+    def __len__(self):
+        return len(self._visible)
+
+    def __getitem__(self, row):
+        return self.columns[self._visible[row]]
+
+    def filter(self, query):
+        query = query.strip().lower()
+        if query == self.query:
+            return
+        # Typing one more character can only narrow the current result.
+        candidates = self._visible if query.startswith(self.query) else range(len(self.columns))
+        self._visible = [index for index in candidates if query in self._lowered[index]]
+        self.query = query
+
+    def is_checked(self, column):
+        return column in self.checked
+
+    def set_checked(self, column, checked):
+        if checked:
+            self.checked.add(column)
+        else:
+            self.checked.discard(column)
+
+    def selected(self):
+        return [column for column in self.columns if column in self.checked]
+
+
+class ColumnList(ctk.CTkFrame):
+    # Only the rows in view get a checkbox; scrolling and filtering re-bind
+    # that small pool of widgets to other columns instead of creating more.
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.model = ColumnSelection()
+        self.top = 0
+        self.text_color = None
+        self.rows = []
+
+        self.search_var = ctk.StringVar()
+        self.search_var.trace_add("write", lambda *args: self.on_search())
+        ctk.CTkEntry(self, textvariable=self.search_var, placeholder_text="Rechercher une colonne").pack(fill='x', padx=5, pady=5)
+
+        body = ctk.CTkFrame(self, fg_color="transparent")
+        body.pack(fill='both', expand=True)
+        self.scrollbar = ctk.CTkScrollbar(body, command=self.on_scroll)
+        self.scrollbar.pack(side='right', fill='y')
+        self.viewport = ctk.CTkFrame(body, fg_color="transparent")
+        self.viewport.pack(side='left', fill='both', expand=True)
+        self.viewport.bind("<Configure>", lambda event: self.render())
+        for widget in (self.viewport, self.scrollbar):
+            widget.bind("<MouseWheel>", self.on_mousewheel)
+            widget.bind("<Button-4>", lambda event: self.scroll_to(self.top - 3))
+            widget.bind("<Button-5>", lambda event: self.scroll_to(self.top + 3))
+
+    def set_columns(self, columns):
+        self.model = ColumnSelection(columns)
+        self.search_var.set("")
+        self.top = 0
+        self.render()
+
+    def selected_columns(self):
+        return self.model.selected()
+
+    def set_text_color(self, color):
+        self.text_color = color
+        for checkbox, _ in self.rows:
+            checkbox.configure(text_color=color)
+
+    def on_search(self):
+        self.model.filter(self.search_var.get())
+        self.top = 0
+        self.render()
+
+    def on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(round(float(amount) * len(self.model)))
+        elif unit == "pages":
+            self.scroll_to(self.top + int(amount) * max(len(self.rows) - 1, 1))
+        else:
+            self.scroll_to(self.top + int(amount))
+
+    def on_mousewheel(self, event):
+        self.scroll_to(self.top - (1 if event.delta > 0 else -1) * 3)
+
+    def scroll_to(self, top):
+        self.top = max(0, min(top, len(self.model) - self.visible_rows()))
+        self.render()
+
+    def visible_rows(self):
+        return max(self.viewport.winfo_height() // ROW_HEIGHT, 1)
+
+    def render(self):
+        visible_rows = self.visible_rows()
+        while len(self.rows) < visible_rows + 1:
+            self.add_row()
+        self.top = max(0, min(self.top, len(self.model) - visible_rows))
+        for slot, (checkbox, var) in enumerate(self.rows):
+            row = self.top + slot
+            if slot <= visible_rows and row < len(self.model):
+                column = self.model[row]
+                checkbox.configure(text=column)
+                var.set(1 if self.model.is_checked(column) else 0)
+                checkbox.place(x=5, y=slot * ROW_HEIGHT)
+            else:
+                checkbox.place_forget()
+        total = len(self.model)
+        if total:
+            self.scrollbar.set(self.top / total, min((self.top + visible_rows) / total, 1.0))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def add_row(self):
+        slot = len(self.rows)
+        var = IntVar()
+        checkbox = ctk.CTkCheckBox(self.viewport, text="", variable=var, fg_color="#0078D4",
+                                   command=lambda: self.on_toggle(slot))
+        if self.text_color:
+            checkbox.configure(text_color=self.text_color)
+        checkbox.bind("<MouseWheel>", self.on_mousewheel)
+        self.rows.append((checkbox, var))
+
+    def on_toggle(self, slot):
+        checkbox, var = self.rows[slot]
+        self.model.set_checked(self.model[self.top + slot], var.get() == 1)
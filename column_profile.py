@@ -0,0 +1,67 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Sheets wider than this are profiled on an evenly spaced row sample.
+WIDE_SHEET_COLUMNS = 50
+SAMPLE_ROWS = 10000
+# Whole-word names only, so "relation" or "colonne" do not match.
+LATITUDE_NAME = re.compile(r'(?<![^\W\d_])(latitude|lat|gps y)(?![^\W\d_])', re.IGNORECASE)
+LONGITUDE_NAME = re.compile(r'(?<![^\W\d_])(longitude|lon|gps x)(?![^\W\d_])', re.IGNORECASE)
+
+
+def profile_column(series):
+    numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+    rows = len(series)
+    nulls = int(series.isna().sum())
+    info = {
+        "dtype": str(series.dtype),
+        "numeric": numeric,
+        "rows": rows,
+        "null_ratio": nulls / rows if rows else 0.0,
+        "distinct": int(series.nunique()),
+        "min": None,
+        "max": None,
+        "latitude_range": False,
+        "longitude_range": False,
+    }
+    if numeric and nulls < rows:
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        info["min"] = float(np.nanmin(values))
+        info["max"] = float(np.nanmax(values))
+        info["latitude_range"] = -90 <= info["min"] and info["max"] <= 90
+        info["longitude_range"] = -180 <= info["min"] and info["max"] <= 180
+    return info
+
+def profile_frame(df):
+    sample = df
+    if len(df.columns) > WIDE_SHEET_COLUMNS and len(df) > SAMPLE_ROWS:
+        sample = df.iloc[::-(-len(df) // SAMPLE_ROWS)]
+    profiles = {}
+    for position, column in enumerate(df.columns):
+        profiles[column] = profile_column(sample.iloc[:, position])
+        profiles[column]["sampled"] = sample is not df
+    return profiles
+
+def _fits(profile, kind):
+    # Empty columns keep their name match, the map reports them as missing.
+    return profile[kind] or profile["null_ratio"] == 1
+
+def detect_gps_columns(df, profiles=None):
+    # Accepts a DataFrame or just the header. With data, a name match only
+    # counts when the values can be WGS84 coordinates.
+    columns = list(getattr(df, 'columns', df))
+    if profiles is None and hasattr(df, 'columns'):
+        candidates = [column for column in columns if isinstance(column, str) and (LATITUDE_NAME.search(column) or LONGITUDE_NAME.search(column))]
+        profiles = profile_frame(df[candidates]) if candidates else {}
+    lat_col = None
+    lon_col = None
+    for col in columns:
+        if not isinstance(col, str):
+            continue
+        if LATITUDE_NAME.search(col) and (profiles is None or _fits(profiles[col], "latitude_range")):
+            lat_col = col
+        if LONGITUDE_NAME.search(col) and (profiles is None or _fits(profiles[col], "longitude_range")):
+            lon_col = col
+    return lat_col, lon_col
@@ -2,11 +2,14 @@ import os
 import sys
 import json
 import logging
-from tkinter import messagebox
-from tkinter import ttk
 
 
+def resource_path(*parts):
+    base_dir = sys._MEIPASS if getattr(sys, 'frozen', False) else os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, *parts)
+
 def apply_style(root):
+    from tkinter import ttk
     style = ttk.Style(root)
     style.theme_use('clam')
     theme_color = "#f0f0f0"
@@ -19,14 +22,13 @@ def apply_style(root):
     style.configure("TEntry", font=("Arial", 12), relief="flat", background=theme_color)
     style.configure("TCheckbutton", font=("Arial", 12), background=theme_color, foreground=text_color)
 
-def load_config():
+def load_config(config_path=None):
     try:
-        config_path = os.path.join(sys._MEIPASS, "config.json") if getattr(sys, 'frozen', False) else "config.json"
+        config_path = config_path or resource_path("config.json")
         with open(config_path, 'r') as config_file:
             config = json.load(config_file)
         logging.info("Configuration loaded successfully.")
         return config
     except Exception as e:
-        logging.error(f"Error loading config file: {e}")
-        messagebox.showerror("Error", f"Failed to load config file: {str(e)}")
-        return None
\ No newline at end of file
+        logging.error("Error loading config file: %s", e)
+        return None
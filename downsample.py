@@ -0,0 +1,97 @@
+import numpy as np
+
+# A 8in wide chart is 800px at the default 100 dpi, one bucket per pixel
+# column keeps the rasterized line identical.
+LINE_BUCKETS = 1000
+DENSITY_BINS = (160, 120)
+
+
+def minmax_downsample(x, y, buckets=LINE_BUCKETS):
+    # Keeps the first, lowest, highest and last point of every bucket, in
+    # their original order, which is all a rasterized line can show.
+    y = np.asarray(y)
+    n = len(y)
+    if n <= 4 * buckets:
+        return np.asarray(x), y
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    rows = padded.reshape(buckets, size)
+    missing = np.isnan(rows)
+    offsets = np.arange(buckets) * size
+    lows = offsets + np.where(missing, np.inf, rows).argmin(axis=1)
+    highs = offsets + np.where(missing, -np.inf, rows).argmax(axis=1)
+    lasts = np.minimum(offsets + size - 1, n - 1)
+    keep = np.unique(np.concatenate([offsets, lows, highs, lasts]))
+    keep = keep[keep < n]
+    return np.asarray(x)[keep], y[keep]
+
+def density_grid(x, y, bins=DENSITY_BINS):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    counts, xedges, yedges = np.histogram2d(x[finite], y[finite], bins=bins)
+    # histogram2d puts x on the first axis, pcolormesh expects rows of y.
+    return counts.T, xedges, yedges
+
+class MinMaxAccumulator:
+    # minmax_downsample over a series that arrives in chunks. Buckets double in
+    # size whenever there would be more than `buckets` of them; the points kept
+    # for two halves always contain the first, lowest, highest and last point
+    # of the merged bucket, so the result stays exact for the final size.
+    def __init__(self, buckets=LINE_BUCKETS, rows=None):
+        self.buckets = buckets
+        self.size = -(-rows // buckets) if rows and rows > 4 * buckets else 1
+        self.count = 0
+        self.x = np.empty(0, dtype=np.int64)
+        self.y = np.empty(0)
+
+    def add(self, y):
+        y = np.asarray(y, dtype=float)
+        self.x = np.concatenate([self.x, np.arange(self.count, self.count + len(y))])
+        self.y = np.concatenate([self.y, y])
+        self.count += len(y)
+        if len(self.x) > 4 * self.buckets:
+            while -(-self.count // self.size) > self.buckets:
+                self.size *= 2
+            keep = _bucket_extremes(self.y, self.x // self.size)
+            self.x, self.y = self.x[keep], self.y[keep]
+
+    def result(self):
+        return self.x, self.y
+
+def _bucket_extremes(y, bucket):
+    # Positions of the first, lowest, highest and last value of every run of
+    # equal bucket ids; lexsort is stable, so ties keep the earliest point.
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(bucket)] - 1
+    lows = np.lexsort((np.where(np.isnan(y), np.inf, y), bucket))[starts]
+    highs = np.lexsort((-np.where(np.isnan(y), -np.inf, y), bucket))[starts]
+    return np.unique(np.concatenate([starts, ends, lows, highs]))
+
+
+class ReservoirSample:
+    # Uniform sample of at most `size` rows of a stream (algorithm R). While
+    # fewer rows have been seen, it holds all of them in order.
+    def __init__(self, size, columns, seed=0):
+        self.size = size
+        self.columns = list(columns)
+        self.count = 0
+        self.values = np.empty((size, len(self.columns)))
+        self._random = np.random.default_rng(seed)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float).reshape(-1, len(self.columns))
+        free = max(min(self.size - self.count, len(values)), 0)
+        self.values[self.count:self.count + free] = values[:free]
+        rest = values[free:]
+        if len(rest):
+            seen = self.count + free + np.arange(1, len(rest) + 1)
+            slots = (self._random.random(len(rest)) * seen).astype(np.int64)
+            taken = slots < self.size
+            # Later rows overwrite earlier ones on the same slot, as in the loop.
+            self.values[slots[taken]] = rest[taken]
+        self.count += len(values)
+
+    def column(self, column):
+        return self.values[:min(self.count, self.size), self.columns.index(column)]
@@ -0,0 +1,437 @@
+import json
+import logging
+import os
+import re
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from aggregates import ColumnAggregates, StreamingAggregates
+from chart_cache import default_chart_cache, load_manifest, pdf_key, update_manifest
+from ingest import CHUNK_ROWS, compact_frame, open_workbook
+from instrument import span
+from column_profile import detect_gps_columns
+from interactive_map import StreamingMap, generate_interactive_map
+from reports import (CHART_TYPES, DISPLAY_TYPES, DEFAULT_CHART_TYPE, DEFAULT_DISPLAY_TYPE, DEFAULT_SCATTER_DENSITY_THRESHOLD,
+                     create_pdf_report, generate_charts, plan_charts, resolve_chart_format)
+
+CANCELLED_MESSAGE = "Génération annulée."
+# Popup column naming the sheet a point comes from on the combined map.
+SOURCE_COLUMN = "Source"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _error(stage, exc):
+    return {"stage": stage, "message": str(exc)}
+
+def _safe_name(name):
+    return re.sub(r'[^\w\-. ]+', '_', str(name)).strip() or "sheet"
+
+def parse_job(spec):
+    charts = []
+    for entry in spec.get('columns', []):
+        if isinstance(entry, str):
+            entry = {"column": entry}
+        column = entry['column']
+        chart_type = entry.get('chart_type', DEFAULT_CHART_TYPE)
+        display_type = entry.get('display_type', DEFAULT_DISPLAY_TYPE)
+        if chart_type not in CHART_TYPES:
+            raise ValueError(f"Unknown chart type for column {column}: {chart_type}")
+        if display_type not in DISPLAY_TYPES:
+            raise ValueError(f"Unknown display type for column {column}: {display_type}")
+        charts.append((column, chart_type, display_type))
+    return {
+        "charts": charts,
+        "pdf": bool(spec.get('pdf', False)),
+        "map": bool(spec.get('map', False)),
+        "map_columns": spec.get('map_columns'),
+        # None lets streaming_enabled decide from the sheet size.
+        "streaming": spec.get('streaming'),
+    }
+
+def load_job(job_path):
+    with open(job_path, 'r', encoding='utf-8') as job_file:
+        return parse_job(json.load(job_file))
+
+def list_targets(workbooks, sheets=None, all_sheets=False, config=None):
+    targets = []
+    for workbook in workbooks:
+        if all_sheets or sheets:
+            with open_workbook(workbook, config) as reader:
+                sheet_names = reader.sheet_names
+            missing = [] if all_sheets else [sheet for sheet in sheets if sheet not in sheet_names]
+            if missing:
+                raise ValueError(f"Sheet(s) not found in {workbook}: {', '.join(map(str, missing))}")
+            selected = sheet_names if all_sheets else [sheet for sheet in sheet_names if sheet in sheets]
+            targets.extend((workbook, sheet) for sheet in selected)
+        else:
+            targets.append((workbook, 0))
+    return targets
+
+def target_output_folder(output_folder, workbook, sheet):
+    workbook_name = os.path.splitext(os.path.basename(workbook))[0]
+    folder = os.path.join(output_folder, _safe_name(workbook_name))
+    if sheet != 0:
+        folder = os.path.join(folder, _safe_name(sheet))
+    return folder
+
+def required_columns(job, header):
+    columns = [column for column, _, _ in job["charts"]]
+    if job["map"]:
+        columns += job["map_columns"] if job["map_columns"] is not None else []
+        columns += [column for column in detect_gps_columns(header) if column]
+    return list(dict.fromkeys(columns))
+
+def streaming_enabled(rows, config, job=None):
+    # Sheets above `streaming_rows` are aggregated chunk by chunk instead of
+    # loaded. Workbooks written without a dimension report no row count, the
+    # job's "streaming" flag forces either mode.
+    if job is not None and job.get('streaming') is not None:
+        return bool(job['streaming'])
+    threshold = (config or {}).get('streaming_rows')
+    return bool(threshold) and rows is not None and rows > threshold
+
+def _cancelled(cancel):
+    return cancel is not None and cancel.is_set()
+
+def _cancelled_error():
+    return _error("cancelled", CANCELLED_MESSAGE)
+
+def _track(charts, total, progress=None, cancel=None):
+    for done, chart in enumerate(charts, 1):
+        if _cancelled(cancel):
+            raise JobCancelled(CANCELLED_MESSAGE)
+        if progress:
+            progress(done, total, chart[0])
+        yield chart
+
+def run_report(df, column_chart_pairs, config, output_folder, pdf=False, chart_workers=None, aggregates=None, progress=None, cancel=None):
+    result = {"charts": [], "pdf": None, "errors": []}
+    if chart_workers is None:
+        chart_workers = config.get('chart_workers')
+    save_png = config.get('save_png', True)
+    chart_cache = default_chart_cache(config)
+    try:
+        plan = plan_charts(df, column_chart_pairs, config, output_folder, aggregates, chart_cache, save_png,
+                           resolve_chart_format(config, pdf))
+        charts = _track(generate_charts(df, column_chart_pairs, config, output_folder, workers=chart_workers,
+                                        chart_cache=chart_cache, save_png=save_png, plan=plan),
+                        len(plan[1]), progress, cancel)
+        pdf_file_path, key = _reusable_pdf(plan[1], config, output_folder) if pdf else (None, None)
+        if not pdf or pdf_file_path:
+            result["charts"] = list(charts)
+            result["pdf"] = pdf_file_path
+            return result
+    except JobCancelled:
+        result["errors"].append(_cancelled_error())
+        return result
+    except Exception as e:
+        logging.error("Error generating charts: %s", e)
+        result["errors"].append(_error("charts", e))
+        return result
+
+    # Pages are added while the remaining charts are still being rendered.
+    state = {"done": False}
+    def collect():
+        for chart in charts:
+            result["charts"].append(chart)
+            yield chart
+        state["done"] = True
+    try:
+        result["pdf"] = create_pdf_report(config, collect(), output_folder)
+        update_manifest(output_folder, pdf={"path": result["pdf"], "key": key})
+    except JobCancelled:
+        result["errors"].append(_cancelled_error())
+    except Exception as e:
+        if not state["done"]:
+            logging.error("Error generating charts: %s", e)
+        result["errors"].append(_error("pdf" if state["done"] else "charts", e))
+    return result
+
+def _reusable_pdf(chart_entries, config, output_folder):
+    key = pdf_key(chart_entries, config, datetime.now().strftime("%Y_%m_%d"))
+    previous = load_manifest(output_folder).get("pdf") or {}
+    if previous.get("key") == key and os.path.exists(previous.get("path", "")):
+        logging.info("Charts unchanged, reusing PDF report: %s", previous['path'])
+        return previous["path"], key
+    return None, key
+
+def run_map(df, columns, output_folder, config=None, aggregates=None, progress=None, cancel=None):
+    result = {"map": None, "errors": []}
+    if _cancelled(cancel):
+        result["errors"].append(_cancelled_error())
+        return result
+    lat_col, lon_col = detect_gps_columns(df, aggregates.profiles() if aggregates is not None else None)
+    if not (lat_col and lon_col):
+        result["errors"].append(_error("map", "latitude ou longitude non trouvée."))
+        return result
+    additional_columns = [column for column in dict.fromkeys(columns) if column not in [lat_col, lon_col]]
+    for column in [column for column in additional_columns if column not in df.columns]:
+        logging.warning("Column %s not found in the DataFrame, left out of the map.", column)
+        additional_columns.remove(column)
+    try:
+        config = config or {}
+        if progress:
+            progress(0, 1, "map")
+        result["map"] = generate_interactive_map(df, lat_col, lon_col, additional_columns, output_folder,
+                                                 large_threshold=config.get('map_large_threshold'),
+                                                 pyramid_threshold=config.get('map_pyramid_threshold'),
+                                                 raw_zoom=config.get('map_raw_zoom'),
+                                                 aggregates=aggregates)
+        update_manifest(output_folder, map={"path": result["map"]})
+        if progress:
+            progress(1, 1, "map")
+    except Exception as e:
+        logging.error("Error generating interactive map: %s", e)
+        result["errors"].append(_error("map", e))
+    return result
+
+def run_job(workbook, sheet, job, config, output_folder, chart_workers=None, progress=None, cancel=None):
+    with span("job", workbook=workbook, sheet=sheet):
+        return _run_job(workbook, sheet, job, config, output_folder, chart_workers, progress, cancel)
+
+def _run_job(workbook, sheet, job, config, output_folder, chart_workers=None, progress=None, cancel=None):
+    result = {"workbook": workbook, "sheet": sheet, "output_folder": output_folder,
+              "charts": [], "pdf": None, "map": None, "errors": []}
+    try:
+        os.makedirs(output_folder, exist_ok=True)
+        with open_workbook(workbook, config) as reader:
+            info = reader.inspect_sheet(sheet)
+            if streaming_enabled(info["rows"], config, job):
+                return _run_streaming_job(reader, sheet, info, job, config, output_folder, result, chart_workers, progress, cancel)
+            df = reader.read_sheet(sheet, required_columns(job, info["columns"]))
+        if config.get('compact_dataframes', True):
+            df = compact_frame(df, detect_gps_columns(df))
+        logging.info("File loaded: %s (sheet %s)", workbook, sheet)
+    except Exception as e:
+        logging.error("Error loading %s (sheet %s): %s", workbook, sheet, e)
+        result["errors"].append(_error("load", e))
+        result["ok"] = False
+        return result
+
+    aggregates = ColumnAggregates(df)
+    if job["charts"]:
+        report = run_report(df, job["charts"], config, output_folder, pdf=job["pdf"], chart_workers=chart_workers,
+                            aggregates=aggregates, progress=progress, cancel=cancel)
+        result["charts"] = [{"column": column, "path": path} for column, path, _ in report["charts"]]
+        result["pdf"] = report["pdf"]
+        result["errors"].extend(report["errors"])
+    if job["map"]:
+        map_columns = job["map_columns"] if job["map_columns"] is not None else [column for column, _, _ in job["charts"]]
+        map_result = run_map(df, map_columns, output_folder, config, aggregates, progress, cancel)
+        result["map"] = map_result["map"]
+        result["errors"].extend(map_result["errors"])
+    result["ok"] = not result["errors"]
+    return result
+
+def _run_streaming_job(reader, sheet, info, job, config, output_folder, result, chart_workers=None, progress=None, cancel=None):
+    logging.info("Streaming %s (sheet %s, %s rows)", reader.file_path, sheet, info["rows"])
+    header = info["columns"]
+    columns = [column for column in required_columns(job, header) if column in header]
+    charted = [(column, chart_type) for column, chart_type, _ in job["charts"] if column in header]
+    aggregates = StreamingAggregates(
+        columns,
+        count_columns=[column for column, chart_type in charted if chart_type in ('Pie Chart', 'Bar Chart')],
+        line_columns=[column for column, chart_type in charted if chart_type == 'Line Chart'],
+        sample_columns=list(dict.fromkeys(column for column, _ in charted)) if any(chart_type == 'Scatter Plot' for _, chart_type in charted) else [],
+        sample_size=config.get('scatter_density_threshold') or DEFAULT_SCATTER_DENSITY_THRESHOLD,
+        rows=info["rows"])
+    streaming_map = None
+    if job["map"]:
+        lat_col, lon_col = detect_gps_columns(header)
+        if lat_col and lon_col:
+            map_columns = job["map_columns"] if job["map_columns"] is not None else [column for column, _, _ in job["charts"]]
+            additional_columns = [column for column in dict.fromkeys(map_columns) if column in header and column not in [lat_col, lon_col]]
+            streaming_map = StreamingMap(lat_col, lon_col, additional_columns, output_folder, config.get('map_raw_zoom'))
+        else:
+            result["errors"].append(_error("map", "latitude ou longitude non trouvée."))
+
+    try:
+        for chunk in reader.iter_chunks(sheet, columns, config.get('streaming_chunk_rows') or CHUNK_ROWS):
+            if _cancelled(cancel):
+                raise JobCancelled(CANCELLED_MESSAGE)
+            aggregates.update(chunk)
+            if streaming_map is not None:
+                try:
+                    streaming_map.add(chunk)
+                except ValueError as e:
+                    logging.error("Error generating interactive map: %s", e)
+                    result["errors"].append(_error("map", e))
+                    streaming_map = None
+            if progress:
+                progress(aggregates.rows, max(info["rows"] or 0, aggregates.rows), "rows")
+    except JobCancelled:
+        result["errors"].append(_cancelled_error())
+        result["ok"] = False
+        return result
+    except Exception as e:
+        logging.error("Error loading %s (sheet %s): %s", reader.file_path, sheet, e)
+        result["errors"].append(_error("load", e))
+        result["ok"] = False
+        return result
+    logging.info("File streamed: %s (sheet %s, %s rows)", reader.file_path, sheet, aggregates.rows)
+
+    if job["charts"]:
+        report = run_report(None, job["charts"], config, output_folder, pdf=job["pdf"], chart_workers=chart_workers,
+                            aggregates=aggregates, progress=progress, cancel=cancel)
+        result["charts"] = [{"column": column, "path": path} for column, path, _ in report["charts"]]
+        result["pdf"] = report["pdf"]
+        result["errors"].extend(report["errors"])
+    if streaming_map is not None:
+        try:
+            result["map"] = streaming_map.close()
+            update_manifest(output_folder, map={"path": result["map"]})
+        except Exception as e:
+            logging.error("Error generating interactive map: %s", e)
+            result["errors"].append(_error("map", e))
+    result["ok"] = not result["errors"]
+    return result
+
+def _failed_target(workbook, sheet, folder, error):
+    return {"workbook": workbook, "sheet": sheet, "output_folder": folder,
+            "charts": [], "pdf": None, "map": None, "errors": [error], "ok": False}
+
+def run_batch(targets, job, config, output_folder, max_workers=None, progress=None, cancel=None):
+    jobs = [(workbook, sheet, job, config, target_output_folder(output_folder, workbook, sheet)) for workbook, sheet in targets]
+    if max_workers == 1 or len(jobs) <= 1:
+        results = []
+        for done, (workbook, sheet, job, config, folder) in enumerate(jobs, 1):
+            if _cancelled(cancel):
+                results.append(_failed_target(workbook, sheet, folder, _cancelled_error()))
+            else:
+                results.append(run_job(workbook, sheet, job, config, folder, cancel=cancel))
+            if progress:
+                progress(done, len(jobs), f"{workbook} ({sheet})")
+        return results
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Each target already has its own process, render its charts serially.
+        futures = [executor.submit(run_job, *args, chart_workers=1) for args in jobs]
+        results = []
+        for done, ((workbook, sheet, _, _, folder), future) in enumerate(zip(jobs, futures), 1):
+            if _cancelled(cancel):
+                # Targets already running in a worker process still finish.
+                for pending in futures:
+                    pending.cancel()
+            try:
+                results.append(future.result())
+            except CancelledError:
+                results.append(_failed_target(workbook, sheet, folder, _cancelled_error()))
+            except Exception as e:
+                logging.error("Worker failed for %s (sheet %s): %s", workbook, sheet, e)
+                results.append(_failed_target(workbook, sheet, folder, _error("worker", e)))
+            if progress:
+                progress(done, len(jobs), f"{workbook} ({sheet})")
+        return results
+
+def run_analysis(targets, job, config, output_folder, combine=False, max_workers=None, progress=None, cancel=None):
+    # Every target runs in its own process, so the batch takes about as long
+    # as its slowest sheet; the combined outputs are built once all are done.
+    if combine and job["charts"]:
+        config = dict(config, save_png=True, chart_format=resolve_chart_format(config, pdf=True))
+    results = run_batch(targets, job, config, output_folder, max_workers, progress, cancel)
+    analysis = {"ok": all(result["ok"] for result in results), "results": results}
+    if combine:
+        analysis["combined"] = combine_results(results, job, config, output_folder, cancel)
+        analysis["ok"] = analysis["ok"] and not analysis["combined"]["errors"]
+    return analysis
+
+def target_label(workbook, sheet):
+    workbook_name = os.path.splitext(os.path.basename(workbook))[0]
+    return workbook_name if sheet == 0 else f"{workbook_name} / {sheet}"
+
+def combine_results(results, job, config, output_folder, cancel=None):
+    # The combined PDF reuses the chart files of every target, the combined
+    # map re-reads the sheets, which the sheet cache makes cheap.
+    combined = {"pdf": None, "map": None, "errors": []}
+    os.makedirs(output_folder, exist_ok=True)
+    charts = [(f"{target_label(result['workbook'], result['sheet'])} - {chart['column']}", chart["path"], None)
+              for result in results for chart in result["charts"]]
+    if charts:
+        try:
+            combined["pdf"] = create_pdf_report(config, charts, output_folder)
+        except Exception as e:
+            combined["errors"].append(_error("combined_pdf", e))
+    if job["map"] and not _cancelled(cancel):
+        with span("combined_map"):
+            _combine_maps(results, job, config, output_folder, combined, cancel)
+    return combined
+
+def _combine_maps(results, job, config, output_folder, combined, cancel=None):
+    sources = []
+    for result in results:
+        if not result["map"]:
+            continue
+        try:
+            with open_workbook(result["workbook"], config) as reader:
+                info = reader.inspect_sheet(result["sheet"])
+        except Exception as e:
+            logging.error("Error loading %s (sheet %s): %s", result["workbook"], result["sheet"], e)
+            combined["errors"].append(_error("combined_map", e))
+            continue
+        sources.append((result, info))
+    if not sources:
+        return
+    map_columns = job["map_columns"] if job["map_columns"] is not None else [column for column, _, _ in job["charts"]]
+    # Every sheet gets the popup columns of the others, so the map keeps its
+    # points instead of dropping them as incomplete.
+    popup_columns = [column for column in dict.fromkeys(map_columns)
+                     if any(column in info["columns"] for _, info in sources)]
+    if any(streaming_enabled(info["rows"], config, job) for _, info in sources):
+        _stream_combined_map(sources, job, config, output_folder, popup_columns, combined, cancel)
+        return
+    frames = []
+    for result, info in sources:
+        try:
+            with open_workbook(result["workbook"], config) as reader:
+                df = reader.read_sheet(result["sheet"], required_columns(job, info["columns"]))
+        except Exception as e:
+            logging.error("Error loading %s (sheet %s): %s", result["workbook"], result["sheet"], e)
+            combined["errors"].append(_error("combined_map", e))
+            continue
+        frames.append(_combined_map_frame(df, detect_gps_columns(df), result, popup_columns))
+    if not frames:
+        return
+    df = pd.concat(frames, ignore_index=True)
+    if config.get('compact_dataframes', True):
+        df = compact_frame(df, ("Latitude", "Longitude"))
+    map_result = run_map(df, popup_columns + [SOURCE_COLUMN], output_folder, config)
+    combined["map"] = map_result["map"]
+    combined["errors"].extend({"stage": "combined_map", "message": error["message"]} for error in map_result["errors"])
+
+def _combined_map_frame(df, gps_columns, result, popup_columns):
+    # Sheets may name their coordinates differently, align them first.
+    lat_col, lon_col = gps_columns
+    df = df.rename(columns={lat_col: "Latitude", lon_col: "Longitude"})
+    for column in popup_columns:
+        if column not in df.columns:
+            df[column] = ""
+    df[SOURCE_COLUMN] = target_label(result["workbook"], result["sheet"])
+    return df
+
+def _stream_combined_map(sources, job, config, output_folder, popup_columns, combined, cancel=None):
+    # With one streamed sheet, loading all of them would defeat streaming:
+    # every sheet is fed to the map chunk by chunk instead.
+    streaming_map = StreamingMap("Latitude", "Longitude", popup_columns + [SOURCE_COLUMN], output_folder, config.get('map_raw_zoom'))
+    for result, info in sources:
+        gps_columns = detect_gps_columns(info["columns"])
+        try:
+            with open_workbook(result["workbook"], config) as reader:
+                for chunk in reader.iter_chunks(result["sheet"], required_columns(job, info["columns"]),
+                                                config.get('streaming_chunk_rows') or CHUNK_ROWS):
+                    if _cancelled(cancel):
+                        combined["errors"].append(_cancelled_error())
+                        return
+                    streaming_map.add(_combined_map_frame(chunk, gps_columns, result, popup_columns))
+        except Exception as e:
+            logging.error("Error streaming %s (sheet %s) to the combined map: %s", result["workbook"], result["sheet"], e)
+            combined["errors"].append(_error("combined_map", e))
+    try:
+        combined["map"] = streaming_map.close()
+        update_manifest(output_folder, map={"path": combined["map"]})
+    except Exception as e:
+        logging.error("Error generating combined map: %s", e)
+        combined["errors"].append(_error("combined_map", e))
@@ -0,0 +1,377 @@
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+from instrument import span
+
+CACHE_VERSION = 4
+CATEGORY_MAX_RATIO = 0.5
+CHUNK_ROWS = 50000
+INGEST_CACHE_MAX_MB = 2000
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+def default_cache_folder(config=None):
+    config = config or {}
+    if not config.get('ingest_cache', True):
+        return None
+    return os.path.expanduser(config.get('cache_folder') or os.path.join("~", ".linkgraph", "cache"))
+
+def file_fingerprint(file_path, content_hash=False):
+    stat = os.stat(file_path)
+    key = [os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, CACHE_VERSION]
+    if content_hash:
+        digest = hashlib.sha1()
+        with open(file_path, 'rb') as workbook_file:
+            for block in iter(lambda: workbook_file.read(1024 * 1024), b''):
+                digest.update(block)
+        key.append(digest.hexdigest())
+    return hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+
+def _sheet_key(sheet_name):
+    return hashlib.sha1(str(sheet_name).encode('utf-8')).hexdigest()
+
+def _convert_cell(cell):
+    # Same conversion as pandas' openpyxl reader, error cells (#DIV/0!,
+    # #REF!...) are missing values.
+    if cell.value is None:
+        return ""
+    if cell.data_type == 'e':
+        return np.nan
+    if isinstance(cell.value, float) and cell.value.is_integer():
+        return int(cell.value)
+    return cell.value
+
+
+def compact_frame(df, gps_columns=(), category_ratio=CATEGORY_MAX_RATIO):
+    before = df.memory_usage(deep=True).sum()
+    compacted = {}
+    for column in df.columns:
+        series = df[column]
+        if column in gps_columns and pd.api.types.is_float_dtype(series):
+            # float32 keeps coordinates to well under a metre.
+            compacted[column] = series.astype('float32')
+        elif pd.api.types.is_integer_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            compacted[column] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            # Only when lossless, chart labels and popups print these values.
+            candidate = series.astype('float32')
+            if np.array_equal(candidate.to_numpy(dtype=float), series.to_numpy(dtype=float), equal_nan=True):
+                compacted[column] = candidate
+        elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            uniques = pd.unique(series.dropna())
+            if len(uniques) <= category_ratio * len(series):
+                # Categories in order of appearance keep value_counts ties in
+                # the same order as on the plain column.
+                compacted[column] = pd.Series(pd.Categorical(series, categories=uniques), index=series.index, name=column)
+    if not compacted:
+        return df
+    df = df.copy(deep=False)
+    for column, values in compacted.items():
+        df[column] = values
+    after = df.memory_usage(deep=True).sum()
+    logging.info("DataFrame compacted: %.1f MB -> %.1f MB (%.1f MB saved)", before / 1048576, after / 1048576, (before - after) / 1048576)
+    return df
+
+
+class WorkbookReader:
+    def __init__(self, file_path, cache_folder=None, content_hash=False, max_bytes=None):
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self._excel_file = None
+        self._sheet_names = None
+        self._sheet_meta = {}
+        self.cache_dir = None
+        if cache_folder:
+            self.cache_dir = os.path.join(cache_folder, file_fingerprint(file_path, content_hash))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def excel_file(self):
+        if self._excel_file is None:
+            with span("file_open", file=self.file_path):
+                self._excel_file = pd.ExcelFile(self.file_path)
+        return self._excel_file
+
+    @property
+    def sheet_names(self):
+        if self._sheet_names is None:
+            meta = self._read_meta()
+            if meta is not None:
+                self._sheet_names = meta['sheet_names']
+            else:
+                self._sheet_names = self.excel_file.sheet_names
+                self._write_meta()
+        return self._sheet_names
+
+    def resolve_sheet(self, sheet_name):
+        return self.sheet_names[sheet_name] if isinstance(sheet_name, int) else sheet_name
+
+    def inspect_sheet(self, sheet_name):
+        sheet_name = self.resolve_sheet(sheet_name)
+        info = self._read_sheet_meta(sheet_name)
+        if info is None:
+            rows = self._row_count(sheet_name)
+            columns = pd.read_excel(self.excel_file, sheet_name=sheet_name, nrows=0).columns.tolist()
+            info = {"columns": columns, "rows": rows, "cached_columns": [], "format": None}
+            self._write_sheet_meta(sheet_name, info)
+        return {"columns": info["columns"], "rows": info["rows"]}
+
+    def read_sheet(self, sheet_name, columns=None):
+        sheet_name = self.resolve_sheet(sheet_name)
+        self.inspect_sheet(sheet_name)
+        info = self._read_sheet_meta(sheet_name)
+        columns = None if columns is None else set(columns)
+        wanted = [column for column in info["columns"] if columns is None or column in columns]
+        if not wanted:
+            return pd.DataFrame()
+        missing = [column for column in wanted if column not in info["cached_columns"]]
+        if not missing:
+            cached = self._read_cached_sheet(sheet_name, info, wanted)
+            if cached is not None:
+                return cached
+            missing = wanted
+
+        with span("sheet_parse", sheet=sheet_name, columns=len(missing)):
+            parsed = self._parse_columns(sheet_name, info["columns"], missing)
+        stored = self._read_cached_sheet(sheet_name, info, [column for column in info["cached_columns"] if column not in missing])
+        if stored is not None and len(stored) == len(parsed):
+            parsed = pd.concat([stored, parsed], axis=1)
+        parsed = parsed[[column for column in info["columns"] if column in parsed.columns]]
+        self._write_sheet(sheet_name, info, parsed)
+        return parsed[[column for column in wanted if column in parsed.columns]]
+
+    def iter_chunks(self, sheet_name, columns, chunk_rows=CHUNK_ROWS):
+        # Yields the wanted columns `chunk_rows` rows at a time, indexed by row
+        # number, without ever holding the whole sheet or filling the cache.
+        sheet_name = self.resolve_sheet(sheet_name)
+        header = self.inspect_sheet(sheet_name)["columns"]
+        columns = [column for column in header if column in set(columns)]
+        indices = [header.index(column) for column in columns]
+        book = self.excel_file.book
+        if not getattr(book, 'read_only', False):
+            raise ValueError(f"Streaming needs an .xlsx workbook: {self.file_path}")
+        worksheet = book[sheet_name]
+        worksheet.reset_dimensions()
+        rows = worksheet.iter_rows(min_row=2)
+        data = []
+        blank = 0
+        start = 0
+        with span("sheet_stream", sheet=sheet_name, columns=len(columns)):
+            for row in rows:
+                if not any(cell.value is not None for cell in row):
+                    # Trailing empty rows are dropped, like read_excel does;
+                    # rows only empty in the wanted columns are kept.
+                    blank += 1
+                    continue
+                data.extend([[""] * len(indices)] * blank)
+                blank = 0
+                data.append([_convert_cell(row[i]) if i < len(row) else "" for i in indices])
+                if len(data) >= chunk_rows:
+                    yield self._chunk_frame(data, columns, start)
+                    start += len(data)
+                    data = []
+            if data:
+                yield self._chunk_frame(data, columns, start)
+
+    def _chunk_frame(self, data, columns, start):
+        df = TextParser(data, header=None, skip_blank_lines=False).read()
+        df.columns = columns
+        df.index = pd.RangeIndex(start, start + len(df))
+        return df
+
+    def close(self):
+        if self._excel_file is not None:
+            self._excel_file.close()
+            self._excel_file = None
+
+    def _row_count(self, sheet_name):
+        book = getattr(self.excel_file, 'book', None)
+        try:
+            if hasattr(book, 'sheet_by_name'):
+                return book.sheet_by_name(sheet_name).nrows - 1
+            max_row = book[sheet_name].max_row
+            return max_row - 1 if max_row else None
+        except Exception:
+            return None
+
+    def _parse_columns(self, sheet_name, header, columns):
+        book = getattr(self.excel_file, 'book', None)
+        if not getattr(book, 'read_only', False):
+            return pd.read_excel(self.excel_file, sheet_name=sheet_name, usecols=columns)
+        # Stream the read-only sheet and only keep the wanted cells, then let
+        # pandas infer dtypes exactly as read_excel would. Rows left empty by
+        # the pruning are kept, only trailing empty rows are dropped.
+        indices = [header.index(column) for column in columns]
+        worksheet = book[sheet_name]
+        worksheet.reset_dimensions()
+        data = []
+        last_row_with_data = -1
+        for row_number, row in enumerate(worksheet.iter_rows()):
+            if any(cell.value is not None for cell in row):
+                last_row_with_data = row_number
+            data.append([_convert_cell(row[i]) if i < len(row) else "" for i in indices])
+        data = data[:last_row_with_data + 1]
+        if not data:
+            return pd.DataFrame(columns=columns)
+        df = TextParser(data, header=0, skip_blank_lines=False).read()
+        df.columns = columns
+        return df
+
+    def _sheet_cache_path(self, sheet_name, extension):
+        return os.path.join(self.cache_dir, f'{_sheet_key(sheet_name)}.{extension}')
+
+    def _read_cached_sheet(self, sheet_name, info, columns):
+        if not self.cache_dir or not columns or not info["format"]:
+            return None
+        cache_path = self._sheet_cache_path(sheet_name, info["format"])
+        try:
+            with span("sheet_cache_read", sheet=sheet_name, columns=len(columns)):
+                if info["format"] == 'parquet':
+                    df = pd.read_parquet(cache_path, columns=columns, memory_map=True)
+                else:
+                    df = pd.read_pickle(cache_path)[columns]
+            # meta.json's mtime records the last use of the entry.
+            os.utime(os.path.join(self.cache_dir, 'meta.json'))
+            logging.info("Sheet %s loaded from ingest cache: %s", sheet_name, cache_path)
+            return df
+        except Exception as e:
+            logging.warning("Ignoring unreadable ingest cache entry %s: %s", cache_path, e)
+            return None
+
+    def _read_sheet_meta(self, sheet_name):
+        if sheet_name in self._sheet_meta:
+            return self._sheet_meta[sheet_name]
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._sheet_cache_path(sheet_name, 'json'), 'r', encoding='utf-8') as meta_file:
+                info = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+        self._sheet_meta[sheet_name] = info
+        return info
+
+    def _write_sheet_meta(self, sheet_name, info):
+        self._sheet_meta[sheet_name] = info
+        if not self.cache_dir:
+            return
+        if self._read_meta() is None:
+            if self._sheet_names is None:
+                self._sheet_names = self.excel_file.sheet_names
+            self._write_meta()
+        meta_path = self._sheet_cache_path(sheet_name, 'json')
+        try:
+            with open(f'{meta_path}.tmp', 'w', encoding='utf-8') as meta_file:
+                json.dump(info, meta_file, default=str)
+            os.replace(f'{meta_path}.tmp', meta_path)
+        except OSError as e:
+            logging.warning("Could not write ingest cache metadata: %s", e)
+
+    def _read_meta(self):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(os.path.join(self.cache_dir, 'meta.json'), 'r', encoding='utf-8') as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self):
+        if not self.cache_dir:
+            return
+        try:
+            self._prune_stale_entries()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = os.path.join(self.cache_dir, 'meta.json.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as meta_file:
+                json.dump({"file_path": os.path.abspath(self.file_path), "sheet_names": self._sheet_names}, meta_file)
+            os.replace(tmp_path, os.path.join(self.cache_dir, 'meta.json'))
+        except OSError as e:
+            logging.warning("Could not write ingest cache metadata: %s", e)
+
+    def _write_sheet(self, sheet_name, info, df):
+        if not self.cache_dir:
+            return
+        # Mixed-type object columns and non-string headers cannot be stored as
+        # Parquet, those sheets (and installs without pyarrow) fall back to pickle.
+        writers = [('pkl', lambda path: df.to_pickle(path))]
+        if HAS_PYARROW:
+            writers.insert(0, ('parquet', lambda path: df.to_parquet(path, index=False)))
+        for extension, write in writers:
+            cache_path = self._sheet_cache_path(sheet_name, extension)
+            tmp_path = f'{cache_path}.tmp'
+            try:
+                write(tmp_path)
+                os.replace(tmp_path, cache_path)
+            except Exception as e:
+                logging.warning("Could not cache sheet as %s: %s", extension, e)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                continue
+            if info["format"] and info["format"] != extension and os.path.exists(self._sheet_cache_path(sheet_name, info["format"])):
+                os.remove(self._sheet_cache_path(sheet_name, info["format"]))
+            info = dict(info, cached_columns=[column for column in info["columns"] if column in df.columns], format=extension)
+            self._write_sheet_meta(sheet_name, info)
+            logging.info("Sheet cached: %s", cache_path)
+            self._prune_to_size()
+            return
+
+    def _prune_stale_entries(self):
+        cache_folder = os.path.dirname(self.cache_dir)
+        if not os.path.isdir(cache_folder):
+            return
+        file_path = os.path.abspath(self.file_path)
+        for entry in os.listdir(cache_folder):
+            entry_dir = os.path.join(cache_folder, entry)
+            if entry_dir == self.cache_dir:
+                continue
+            try:
+                with open(os.path.join(entry_dir, 'meta.json'), 'r', encoding='utf-8') as meta_file:
+                    stale = json.load(meta_file).get('file_path') == file_path
+            except (OSError, ValueError):
+                continue
+            if stale:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+
+    def _prune_to_size(self):
+        # Least recently used workbooks go first, until the cache fits
+        # max_bytes. Folders without meta.json (the chart cache) are not ours.
+        if self.max_bytes is None:
+            return
+        cache_folder = os.path.dirname(self.cache_dir)
+        entries = []
+        for entry in os.listdir(cache_folder):
+            entry_dir = os.path.join(cache_folder, entry)
+            try:
+                last_use = os.stat(os.path.join(entry_dir, 'meta.json')).st_mtime_ns
+                size = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+            except OSError:
+                continue
+            entries.append((last_use, size, entry_dir))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry_dir == self.cache_dir:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            logging.info("Ingest cache entry pruned: %s", entry_dir)
+
+def open_workbook(file_path, config=None):
+    config = config or {}
+    return WorkbookReader(file_path, default_cache_folder(config), config.get('cache_content_hash', False),
+                          config.get('ingest_cache_max_mb', INGEST_CACHE_MAX_MB) * 1024 * 1024)
@@ -0,0 +1,123 @@
+import cProfile
+import importlib.util
+import itertools
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+HAS_PSUTIL = importlib.util.find_spec("psutil") is not None
+HAS_PYINSTRUMENT = importlib.util.find_spec("pyinstrument") is not None
+# Worker processes inherit the spans file through the environment.
+SPANS_ENV = "LINKGRAPH_SPANS"
+
+span_logger = logging.getLogger("linkgraph.spans")
+span_logger.propagate = False
+_ids = itertools.count(1)
+_local = threading.local()
+_process = None
+
+
+def configure(spans_file=None):
+    # Enables spans for this process and the worker processes it starts.
+    for handler in list(span_logger.handlers):
+        span_logger.removeHandler(handler)
+        handler.close()
+    if spans_file:
+        os.environ[SPANS_ENV] = spans_file
+        handler = logging.FileHandler(spans_file, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        span_logger.addHandler(handler)
+        span_logger.setLevel(logging.INFO)
+    else:
+        os.environ.pop(SPANS_ENV, None)
+        span_logger.setLevel(logging.CRITICAL)
+
+def enabled():
+    return span_logger.isEnabledFor(logging.INFO)
+
+def current_rss():
+    global _process
+    if HAS_PSUTIL:
+        import psutil
+        if _process is None:
+            _process = psutil.Process()
+        return _process.memory_info().rss
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+@contextmanager
+def span(name, **fields):
+    if not enabled():
+        yield
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    span_id = next(_ids)
+    parent = stack[-1] if stack else None
+    stack.append(span_id)
+    rss_start = current_rss()
+    cpu_start = time.thread_time()
+    start = time.perf_counter()
+    started_at = time.time()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        wall = time.perf_counter() - start
+        cpu = time.thread_time() - cpu_start
+        rss_end = current_rss()
+        stack.pop()
+        record = {"span": name, "id": f'{os.getpid()}-{span_id}', "parent": f'{os.getpid()}-{parent}' if parent else None,
+                  "pid": os.getpid(), "thread": threading.current_thread().name, "start": round(started_at, 6),
+                  "wall_ms": round(wall * 1000, 3), "cpu_ms": round(cpu * 1000, 3),
+                  "rss_mb": round(rss_end / 1048576, 2) if rss_end is not None else None,
+                  "rss_delta_mb": round((rss_end - rss_start) / 1048576, 2) if rss_end is not None and rss_start is not None else None}
+        if error:
+            record["error"] = error
+        record.update(fields)
+        span_logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+@contextmanager
+def profiled(output_path):
+    # cProfile only sees the thread it was enabled on, wrap the whole run.
+    if not output_path:
+        yield
+        return
+    if HAS_PYINSTRUMENT and output_path.endswith('.html'):
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(output_path, 'w', encoding='utf-8') as profile_file:
+                profile_file.write(profiler.output_html())
+            logging.info("Profile written to %s", output_path)
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_path)
+        with open(f'{output_path}.txt', 'w', encoding='utf-8') as summary_file:
+            pstats.Stats(profiler, stream=summary_file).sort_stats('cumulative').print_stats(50)
+        logging.info("Profile written to %s", output_path)
+
+if os.environ.get(SPANS_ENV):
+    configure(os.environ[SPANS_ENV])
+else:
+    span_logger.setLevel(logging.CRITICAL)
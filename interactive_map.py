@@ -1,69 +1,363 @@
+import json
 import logging
 import os
-import re
+import shutil
 import folium
 import folium.plugins as plugins
+import numpy as np
+import pandas as pd
 from datetime import datetime
-from tkinter import messagebox
+from folium.template import Template
+from column_profile import profile_frame
+from instrument import span
+from spatial import CELLS_PER_TILE, CHUNK_ZOOM, build_cluster_pyramid, cluster_level, group_by_chunk, level_entries, pyramid_levels, split_by_chunk
 
+DEFAULT_LARGE_THRESHOLD = 20000
+DEFAULT_PYRAMID_THRESHOLD = 200000
+DEFAULT_RAW_ZOOM = 13
+POINT_DATA_VARIABLE = "linkgraph_points"
+PYRAMID_DATA_VARIABLE = "linkgraph_pyramid"
+CHUNK_CALLBACK = "linkgraph_add_chunk"
+# Every colour marker_colors can return, in np.unique order.
+MARKER_PALETTE = ["blue", "green", "orange", "red"]
+INVALID_COORDINATES = "Latitude or longitude values are not valid WGS84 coordinates."
+NO_COORDINATES = "No valid coordinates found after removing missing values."
 
-def detect_gps_columns(df):
-    lat_col = None
-    lon_col = None
-    for col in df.columns:
-        if re.search(r'latitude|lat|gps y', col, re.IGNORECASE):
-            lat_col = col
-        if re.search(r'longitude|lon|gps x', col, re.IGNORECASE):
-            lon_col = col
-    return lat_col, lon_col
 
+def _as_text(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.map(str)
+    # astype(str) keeps missing values as NaN, spell them "nan" like the
+    # per-row f-strings did.
+    return series.astype(str).fillna("nan")
 
-def generate_interactive_map(df, lat_col, lon_col, additional_columns, output_folder):
+def _contains(series, text, aggregates=None):
+    # Match on the distinct values only, then broadcast back to the rows.
+    if aggregates is not None:
+        return series.isin(aggregates.matching_values(series.name, text)).to_numpy()
+    uniques = pd.Series(series.unique())
+    matches = uniques[_as_text(uniques).str.lower().str.contains(text, regex=False)]
+    return series.isin(matches).to_numpy()
+
+def marker_colors(df, additional_columns, aggregates=None):
+    red = np.zeros(len(df), dtype=bool)
+    for col in additional_columns:
+        red |= _contains(df[col], "non éligible", aggregates)
+    # "Non éligible" never matches a lowercased value, so the purple/black
+    # branches of the FTTO/FTTH statuses are never taken.
+    conditions = [red]
+    choices = ["red"]
+    if 'FTTO' in df.columns:
+        conditions.insert(0, _contains(df['FTTO'], "éligible", aggregates))
+        choices.insert(0, "orange")
+    if 'FTTH' in df.columns:
+        conditions.insert(0, _contains(df['FTTH'], "éligible", aggregates))
+        choices.insert(0, "blue")
+    return np.select(conditions, choices, default="green")
+
+def _labelled_text(series, label):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Format each category once and pick the texts by code, missing
+        # values have code -1 and get the trailing "nan".
+        texts = (label + _as_text(pd.Series(series.cat.categories))).tolist() + [label + "nan"]
+        return pd.Series(np.array(texts, dtype=object)[series.cat.codes.to_numpy()], index=series.index)
+    return label + _as_text(series)
+
+def popup_html(df, additional_columns):
+    if not additional_columns:
+        return [None] * len(df)
+    fields = [_labelled_text(df[col], f"{col}: ") for col in additional_columns]
+    return fields[0].str.cat(fields[1:], sep="<br>").tolist()
+
+def _write_script(data_file_path, prefix, payload, suffix=";\n"):
+    with open(data_file_path, 'w', encoding='utf-8') as data_file:
+        # json.dumps uses the C encoder, json.dump does not.
+        data_file.write(prefix + json.dumps(payload, ensure_ascii=False, separators=(',', ':')) + suffix)
+
+def _point_rows(lats, lons, color_codes, popups):
+    points = zip(np.round(lats, 6).tolist(), np.round(lons, 6).tolist(), color_codes.tolist(), popups)
+    return [list(point) for point in points]
+
+def write_point_data(data_file_path, lats, lons, colors, popups):
+    palette, color_codes = np.unique(colors, return_inverse=True)
+    payload = {"colors": palette.tolist(), "points": _point_rows(lats, lons, color_codes, popups)}
+    _write_script(data_file_path, f"var {POINT_DATA_VARIABLE} = ", payload)
+
+def _point_chunks(lats, lons, color_codes, popups):
+    popups = np.asarray(popups, dtype=object)
+    for key, rows in group_by_chunk(lats, lons):
+        yield key, _point_rows(lats[rows], lons[rows], color_codes[rows], popups[rows].tolist())
+
+def write_pyramid_data(data_file_path, tiles_folder, lats, lons, colors, popups, raw_zoom):
+    palette, color_codes = np.unique(colors, return_inverse=True)
+    levels, color_columns = build_cluster_pyramid(lats, lons, color_codes, len(palette), max_zoom=raw_zoom - 1)
+    shutil.rmtree(tiles_folder, ignore_errors=True)
+    os.makedirs(tiles_folder)
+    chunks = []
+    for key, rows in _point_chunks(lats, lons, color_codes, popups):
+        chunks.append(key)
+        _write_script(os.path.join(tiles_folder, f'{key}_points.js'), f'{CHUNK_CALLBACK}("{key}", "points", ', rows, ");\n")
+    write_pyramid_index(data_file_path, tiles_folder, levels, color_columns, palette.tolist(), raw_zoom, chunks)
+
+def write_pyramid_index(data_file_path, tiles_folder, levels, color_columns, palette, raw_zoom, chunks):
+    top_levels = {}
+    chunk_levels = {}
+    for zoom, level in levels.items():
+        if zoom < CHUNK_ZOOM:
+            top_levels[zoom] = level_entries(level, color_columns)
+        else:
+            for key, entries in split_by_chunk(level, zoom, color_columns).items():
+                chunk_levels.setdefault(key, {})[zoom] = entries
+    for key, chunk in chunk_levels.items():
+        _write_script(os.path.join(tiles_folder, f'{key}_agg.js'), f'{CHUNK_CALLBACK}("{key}", "agg", ', chunk, ");\n")
+
+    payload = {"colors": palette, "levels": top_levels, "raw_zoom": raw_zoom, "chunk_zoom": CHUNK_ZOOM,
+               "cells_per_tile": CELLS_PER_TILE, "tiles": os.path.basename(tiles_folder), "chunks": chunks}
+    _write_script(data_file_path, f"var {PYRAMID_DATA_VARIABLE} = ", payload)
+
+class PointDataCluster(plugins.MarkerCluster):
+    # Builds the cluster in the browser from the sidecar data file instead of
+    # serializing one folium.Marker per row into the page.
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.markerClusterGroup(
+                {{ this.options|tojavascript }}
+            );
+            (function (data) {
+                var markers = [];
+                for (var i = 0; i < data.points.length; i++) {
+                    var point = data.points[i];
+                    var marker = L.marker([point[0], point[1]], {
+                        icon: L.AwesomeMarkers.icon({
+                            icon: "info-sign", iconColor: "white", prefix: "glyphicon",
+                            markerColor: data.colors[point[2]]
+                        })
+                    });
+                    if (point[3]) {
+                        marker.bindPopup(point[3]);
+                    }
+                    markers.push(marker);
+                }
+                {{ this.get_name() }}.addLayers(markers);
+            })({{ this.data_variable }});
+        {% endmacro %}
+        """)
+
+    def __init__(self, data_variable=POINT_DATA_VARIABLE, **kwargs):
+        super().__init__(**kwargs)
+        self._name = "PointDataCluster"
+        self.data_variable = data_variable
+
+
+class SpatialPyramidLayer(plugins.MarkerCluster):
+    # Shows the pre-aggregated grid level matching the zoom and only loads the
+    # chunks of deep levels and raw points that intersect the viewport.
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.layerGroup();
+            (function (pyramid, map, aggregates) {
+                var points = L.markerClusterGroup({{ this.options|tojavascript }});
+                var available = {}, requested = {}, chunkLevels = {}, pendingRefresh = null;
+                pyramid.chunks.forEach(function (key) { available[key] = true; });
+
+                function visibleChunks() {
+                    var bounds = map.getBounds(), n = Math.pow(2, pyramid.chunk_zoom) * pyramid.cells_per_tile;
+                    var clamp = function (value) { return Math.max(0, Math.min(n - 1, Math.floor(value))); };
+                    var cellY = function (lat) {
+                        lat = Math.max(Math.min(lat, 85.0511), -85.0511) * Math.PI / 180;
+                        return clamp((1 - Math.log(Math.tan(lat) + 1 / Math.cos(lat)) / Math.PI) / 2 * n);
+                    };
+                    var x0 = clamp((bounds.getWest() + 180) / 360 * n), x1 = clamp((bounds.getEast() + 180) / 360 * n);
+                    var y0 = cellY(bounds.getNorth()), y1 = cellY(bounds.getSouth()), keys = [];
+                    for (var cx = x0; cx <= x1; cx++) {
+                        for (var cy = y0; cy <= y1; cy++) {
+                            if (available[cx + "_" + cy]) { keys.push(cx + "_" + cy); }
+                        }
+                    }
+                    return keys;
+                }
+                function request(key, kind) {
+                    if (requested[key + "_" + kind]) { return; }
+                    requested[key + "_" + kind] = true;
+                    var script = document.createElement("script");
+                    script.src = pyramid.tiles + "/" + key + "_" + kind + ".js";
+                    document.head.appendChild(script);
+                }
+                function pointMarker(point) {
+                    var marker = L.marker([point[0], point[1]], {
+                        icon: L.AwesomeMarkers.icon({
+                            icon: "info-sign", iconColor: "white", prefix: "glyphicon",
+                            markerColor: pyramid.colors[point[2]]
+                        })
+                    });
+                    if (point[3]) {
+                        marker.bindPopup(point[3]);
+                    }
+                    return marker;
+                }
+                function aggregateMarker(entry) {
+                    var counts = entry[3], dominant = 0, lines = ["<b>" + entry[2] + "</b>"];
+                    for (var i = 0; i < counts.length; i++) {
+                        if (counts[i] > counts[dominant]) { dominant = i; }
+                        if (counts[i]) { lines.push(pyramid.colors[i] + ": " + counts[i]); }
+                    }
+                    return L.circleMarker([entry[0], entry[1]], {
+                        radius: 6 + 4 * Math.log10(entry[2]), color: pyramid.colors[dominant], weight: 1, fillOpacity: 0.6
+                    }).bindTooltip(lines.join("<br>"));
+                }
+                function refresh() {
+                    var zoom = map.getZoom(), bounds = map.getBounds().pad(0.2), entries = [];
+                    aggregates.clearLayers();
+                    if (zoom >= pyramid.raw_zoom) {
+                        visibleChunks().forEach(function (key) { request(key, "points"); });
+                        if (!map.hasLayer(points)) { map.addLayer(points); }
+                        return;
+                    }
+                    if (map.hasLayer(points)) { map.removeLayer(points); }
+                    if (pyramid.levels[zoom]) {
+                        entries = pyramid.levels[zoom];
+                    } else {
+                        visibleChunks().forEach(function (key) {
+                            if (chunkLevels[key]) {
+                                entries = entries.concat(chunkLevels[key][zoom] || []);
+                            } else {
+                                request(key, "agg");
+                            }
+                        });
+                    }
+                    entries.forEach(function (entry) {
+                        if (bounds.contains([entry[0], entry[1]])) { aggregates.addLayer(aggregateMarker(entry)); }
+                    });
+                }
+                window.{{ this.callback }} = function (key, kind, data) {
+                    if (kind === "points") {
+                        points.addLayers(data.map(pointMarker));
+                    } else {
+                        chunkLevels[key] = data;
+                        if (!pendingRefresh) {
+                            pendingRefresh = setTimeout(function () { pendingRefresh = null; refresh(); }, 50);
+                        }
+                    }
+                };
+                map.on("moveend", refresh);
+                map.whenReady(refresh);
+            })({{ this.data_variable }}, {{ this._parent.get_name() }}, {{ this.get_name() }});
+        {% endmacro %}
+        """)
+
+    def __init__(self, data_variable=PYRAMID_DATA_VARIABLE, callback=CHUNK_CALLBACK, **kwargs):
+        super().__init__(**kwargs)
+        self._name = "SpatialPyramidLayer"
+        self.data_variable = data_variable
+        self.callback = callback
+
+
+def generate_interactive_map(df, lat_col, lon_col, additional_columns, output_folder, large_threshold=None, pyramid_threshold=None, raw_zoom=None, aggregates=None):
     if lat_col not in df.columns or lon_col not in df.columns:
-        messagebox.showerror("Error", "Invalid latitude or longitude column selection.")
-        return
+        raise ValueError("Invalid latitude or longitude column selection.")
+    profiles = aggregates.profiles() if aggregates is not None else profile_frame(df[[lat_col, lon_col]])
     df = df[[lat_col, lon_col] + additional_columns].dropna()
     if df.empty:
-        messagebox.showerror("Error", "No valid coordinates found after removing missing values.")
-        return
+        raise ValueError(NO_COORDINATES)
+    if not (profiles[lat_col]["latitude_range"] and profiles[lon_col]["longitude_range"]):
+        raise ValueError(INVALID_COORDINATES)
+    if large_threshold is None:
+        large_threshold = DEFAULT_LARGE_THRESHOLD
+    if pyramid_threshold is None:
+        pyramid_threshold = DEFAULT_PYRAMID_THRESHOLD
 
+    map_file_path = os.path.join(output_folder, f'Interactive_Map_{datetime.now().strftime("%Y_%m_%d")}.html')
+    base_name = os.path.splitext(os.path.basename(map_file_path))[0]
     m = folium.Map(location=[df[lat_col].mean(), df[lon_col].mean()], zoom_start=6)
-    marker_cluster = plugins.MarkerCluster().add_to(m)
-
-    for _, row in df.iterrows():
-        popup_text = ""
-        for col in additional_columns:
-            popup_text += f"{col}: {row[col]}<br>"
-
-        color = "green"
-
-        for col in additional_columns:
-            if "non éligible" in str(row[col]).lower():
-                color = "red"
-                break
-
-        if 'FTTO' in df.columns:
-            if "éligible" in str(row['FTTO']).lower():
-                color = "orange"
-            elif "Non éligible" in str(row['FTTO']).lower():
-                color = "purple"
-            elif "Sur Devis - 1G" in str(row['FTTO']).lower():
-                color = "orange"
-        if 'FTTH' in df.columns:
-            if "éligible" in str(row['FTTH']).lower():
-                color = "blue"
-            elif "Non éligible" in str(row['FTTH']).lower():
-                color = "black"
-
-        marker = folium.Marker(
-            location=[row[lat_col], row[lon_col]],
-            popup=popup_text.strip("<br>"),
-            icon=folium.Icon(color=color)
-        )
-        marker.add_to(marker_cluster)
 
-    map_file_path = os.path.join(output_folder, f'Interactive_Map_{datetime.now().strftime("%Y_%m_%d")}.html')
-    m.save(map_file_path)
+    popups = popup_html(df, additional_columns)
+    colors = marker_colors(df, additional_columns, aggregates)
+    lats = df[lat_col].to_numpy(dtype=float)
+    lons = df[lon_col].to_numpy(dtype=float)
+    if pyramid_threshold and len(df) > pyramid_threshold:
+        data_file_name = f'{base_name}_pyramid.js'
+        with span("map_data", mode="pyramid", points=len(df)):
+            write_pyramid_data(os.path.join(output_folder, data_file_name), os.path.join(output_folder, f'{base_name}_tiles'),
+                               lats, lons, colors, popups, raw_zoom or DEFAULT_RAW_ZOOM)
+        m.get_root().header.add_child(folium.JavascriptLink(data_file_name))
+        SpatialPyramidLayer(chunkedLoading=True).add_to(m)
+        logging.info("Spatial pyramid map mode: %s points aggregated in %s", len(df), data_file_name)
+    elif large_threshold and len(df) > large_threshold:
+        data_file_name = f'{base_name}_data.js'
+        with span("map_data", mode="large", points=len(df)):
+            write_point_data(os.path.join(output_folder, data_file_name), lats, lons, colors, popups)
+        m.get_root().header.add_child(folium.JavascriptLink(data_file_name))
+        PointDataCluster(chunkedLoading=True).add_to(m)
+        logging.info("Large dataset map mode: %s points written to %s", len(df), data_file_name)
+    else:
+        marker_cluster = plugins.MarkerCluster().add_to(m)
+        for lat, lon, popup, color in zip(lats, lons, popups, colors):
+            folium.Marker(location=[lat, lon], popup=popup, icon=folium.Icon(color=color)).add_to(marker_cluster)
+
+    with span("map_serialize", path=map_file_path):
+        m.save(map_file_path)
+
+    logging.info("Interactive map generated: %s", map_file_path)
+    return map_file_path
+
+
+class StreamingMap:
+    # Spatial pyramid map fed one chunk of rows at a time: raw points are
+    # appended to their tile files right away and only the per-cell counts of
+    # the deepest aggregated level stay in memory.
+    def __init__(self, lat_col, lon_col, additional_columns, output_folder, raw_zoom=None):
+        self.lat_col = lat_col
+        self.lon_col = lon_col
+        self.additional_columns = list(additional_columns)
+        self.output_folder = output_folder
+        self.raw_zoom = raw_zoom or DEFAULT_RAW_ZOOM
+        self.map_file_path = os.path.join(output_folder, f'Interactive_Map_{datetime.now().strftime("%Y_%m_%d")}.html')
+        base_name = os.path.splitext(os.path.basename(self.map_file_path))[0]
+        self.data_file_name = f'{base_name}_pyramid.js'
+        self.tiles_folder = os.path.join(output_folder, f'{base_name}_tiles')
+        shutil.rmtree(self.tiles_folder, ignore_errors=True)
+        os.makedirs(self.tiles_folder)
+        self.level = None
+        self.color_columns = None
+        self.chunks = {}
+        self.points = 0
+        self.lat_sum = 0.0
+        self.lon_sum = 0.0
+
+    def add(self, chunk):
+        df = chunk[[self.lat_col, self.lon_col] + self.additional_columns].dropna()
+        if df.empty:
+            return
+        if not (pd.api.types.is_numeric_dtype(df[self.lat_col]) and pd.api.types.is_numeric_dtype(df[self.lon_col])):
+            raise ValueError(INVALID_COORDINATES)
+        lats = df[self.lat_col].to_numpy(dtype=float)
+        lons = df[self.lon_col].to_numpy(dtype=float)
+        if np.abs(lats).max() > 90 or np.abs(lons).max() > 180:
+            raise ValueError(INVALID_COORDINATES)
+        color_codes = np.searchsorted(MARKER_PALETTE, marker_colors(df, self.additional_columns))
+        level, self.color_columns = cluster_level(lats, lons, color_codes, len(MARKER_PALETTE), self.raw_zoom - 1)
+        self.level = level if self.level is None else self.level.add(level, fill_value=0)
+        for key, rows in _point_chunks(lats, lons, color_codes, popup_html(df, self.additional_columns)):
+            self.chunks[key] = True
+            # A tile file may hold several calls, one per chunk of rows.
+            with open(os.path.join(self.tiles_folder, f'{key}_points.js'), 'a', encoding='utf-8') as data_file:
+                data_file.write(f'{CHUNK_CALLBACK}("{key}", "points", ' + json.dumps(rows, ensure_ascii=False, separators=(',', ':')) + ");\n")
+        self.points += len(df)
+        self.lat_sum += float(lats.sum())
+        self.lon_sum += float(lons.sum())
 
-    logging.info(f"Interactive map generated: {map_file_path}")
-    messagebox.showinfo("Success", f"Interactive map has been generated successfully: {map_file_path}")
+    def close(self):
+        if not self.points:
+            raise ValueError(NO_COORDINATES)
+        level = self.level.astype({column: np.int64 for column in self.color_columns})
+        with span("map_data", mode="streaming", points=self.points):
+            write_pyramid_index(os.path.join(self.output_folder, self.data_file_name), self.tiles_folder,
+                                pyramid_levels(level, self.raw_zoom - 1), self.color_columns, MARKER_PALETTE,
+                                self.raw_zoom, list(self.chunks))
+        m = folium.Map(location=[self.lat_sum / self.points, self.lon_sum / self.points], zoom_start=6)
+        m.get_root().header.add_child(folium.JavascriptLink(self.data_file_name))
+        SpatialPyramidLayer(chunkedLoading=True).add_to(m)
+        with span("map_serialize", path=self.map_file_path):
+            m.save(self.map_file_path)
+        logging.info("Streaming map mode: %s points written to %s", self.points, self.tiles_folder)
+        return self.map_file_path
@@ -0,0 +1,81 @@
+import logging
+import queue
+import threading
+
+POLL_INTERVAL_MS = 100
+
+
+class JobRunner:
+    # Runs one pipeline at a time on a worker thread. Tk widgets may only be
+    # touched from the main thread, so progress and results go through a queue
+    # that the window drains with after().
+    def __init__(self, root, poll_interval=POLL_INTERVAL_MS):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.name = None
+        self._events = queue.Queue()
+        self._thread = None
+        self._cancel = threading.Event()
+        self._on_progress = None
+        self._on_done = None
+
+    @property
+    def busy(self):
+        return self._thread is not None
+
+    def submit(self, name, target, *args, on_progress=None, on_done=None, **kwargs):
+        # `target` is called with extra `progress` and `cancel` keyword
+        # arguments and its return value is handed to `on_done`.
+        if self.busy:
+            logging.warning("Job %s still running, ignoring %s", self.name, name)
+            return False
+        self.name = name
+        self._cancel = threading.Event()
+        self._on_progress = on_progress
+        self._on_done = on_done
+        kwargs.update(progress=self._progress, cancel=self._cancel)
+        self._thread = threading.Thread(target=self._run, args=(target, args, kwargs), name=f"linkgraph-{name}", daemon=True)
+        logging.info("Job started: %s", name)
+        self._thread.start()
+        self.root.after(self.poll_interval, self.poll)
+        return True
+
+    def cancel(self):
+        if self.busy:
+            logging.info("Cancelling job: %s", self.name)
+            self._cancel.set()
+
+    def poll(self):
+        while True:
+            try:
+                kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                if self._on_progress:
+                    self._on_progress(*payload)
+            else:
+                self._finish(kind, payload)
+                return
+        if self.busy:
+            self.root.after(self.poll_interval, self.poll)
+
+    def _progress(self, done, total, label):
+        self._events.put(("progress", (done, total, label)))
+
+    def _run(self, target, args, kwargs):
+        try:
+            self._events.put(("done", target(*args, **kwargs)))
+        except Exception as e:
+            logging.error("Job %s failed: %s", self.name, e)
+            self._events.put(("error", e))
+
+    def _finish(self, kind, payload):
+        on_done = self._on_done
+        logging.info("Job finished: %s", self.name)
+        self._thread.join()
+        self._thread = None
+        self._on_progress = None
+        self._on_done = None
+        if on_done:
+            on_done(payload if kind == "done" else {"errors": [{"stage": "job", "message": str(payload)}]})
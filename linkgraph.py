@@ -0,0 +1,52 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import sys
+
+from config import load_config
+from engine import list_targets, load_job, run_analysis
+from instrument import configure, profiled
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="linkgraph", description="Generate Linkgraph charts, PDF reports and interactive maps without the GUI.")
+    parser.add_argument("workbooks", nargs="+", help="Excel workbooks to process")
+    parser.add_argument("--job", required=True, help="JSON job spec (columns, chart types, display types, pdf, map)")
+    parser.add_argument("--output", default=None, help="output folder (defaults to output_folder from config.json)")
+    parser.add_argument("--sheet", action="append", dest="sheets", help="sheet to process, can be repeated (defaults to the first sheet)")
+    parser.add_argument("--all-sheets", action="store_true", help="process every sheet of every workbook")
+    parser.add_argument("--streaming", action="store_true", help="aggregate the sheets chunk by chunk instead of loading them (automatic above streaming_rows)")
+    parser.add_argument("--combined", action="store_true", help="also write one PDF and one map covering every workbook and sheet")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--config", default=None, help="path to config.json")
+    parser.add_argument("--spans", default=None, help="write timing/memory spans as JSON lines to this file")
+    parser.add_argument("--profile", default=None, help="write a cProfile dump of the run (.html uses pyinstrument when installed); use --workers 1 to include the per-workbook work")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+    config = load_config(args.config)
+    if not config:
+        print(json.dumps({"ok": False, "errors": [{"stage": "config", "message": "Configuration not loaded."}]}))
+        return 2
+    try:
+        job = load_job(args.job)
+        if args.streaming:
+            job["streaming"] = True
+        targets = list_targets(args.workbooks, args.sheets, args.all_sheets, config)
+    except Exception as e:
+        print(json.dumps({"ok": False, "errors": [{"stage": "job", "message": str(e)}]}))
+        return 2
+
+    configure(args.spans or config.get('spans_file'))
+    with profiled(args.profile or config.get('profile_file')):
+        analysis = run_analysis(targets, job, config, args.output or config.get('output_folder', '.'), args.combined, args.workers)
+    print(json.dumps(analysis, ensure_ascii=False, indent=2, default=str))
+    return 0 if analysis["ok"] else 1
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
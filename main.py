@@ -1,15 +1,16 @@
 import logging
-import os
-import sys
+import multiprocessing
+import threading
 import customtkinter as ctk
-from tkinter import filedialog, messagebox, IntVar, BooleanVar
+from tkinter import filedialog, messagebox, BooleanVar
 from PIL import Image
-from PIL.Image import Resampling
-import pandas as pd
-import re
-from config import apply_style, load_config
-from interactive_map import generate_interactive_map
-from reports import generate_charts, create_pdf_report
+from config import apply_style, load_config, resource_path
+from column_list import ColumnList
+from instrument import configure, profiled
+from jobs import JobRunner
+
+# pandas, matplotlib, reportlab and folium take most of the startup time.
+# They are imported where first used, and preloaded once the window is up.
 
 APP_VERSION = "BETA V0.2.0"
 
@@ -26,56 +27,59 @@ logging.basicConfig(
 ctk.set_appearance_mode("Light")
 ctk.set_default_color_theme("blue")
 
-def detect_gps_columns(df):
-    lat_col = None
-    lon_col = None
-    for col in df.columns:
-        if re.search(r'latitude|lat|gps y', col, re.IGNORECASE):
-            lat_col = col
-        if re.search(r'longitude|lon|gps x', col, re.IGNORECASE):
-            lon_col = col
-    return lat_col, lon_col
+def preload():
+    import engine
+    logging.info("Analysis modules loaded")
 
 class SheetSelectionDialog(ctk.CTkToplevel):
     def __init__(self, parent, sheets, callback):
         super().__init__(parent)
         self.title("Select Sheet")
-        self.geometry("300x200")
+        self.geometry("300x300")
         self.callback = callback
         self.sheets = sheets
-        self.sheet_var = ctk.StringVar(value=sheets[0])
-        ctk.CTkLabel(self, text="Select the sheet:").pack(pady=10)
-        ctk.CTkOptionMenu(self, variable=self.sheet_var, values=sheets).pack(pady=10)
+        self.sheet_vars = {}
+        ctk.CTkLabel(self, text="Select the sheets:").pack(pady=10)
+        frame = ctk.CTkScrollableFrame(self)
+        frame.pack(fill='both', expand=True, padx=10)
+        for index, sheet in enumerate(sheets):
+            var = BooleanVar(value=index == 0)
+            ctk.CTkCheckBox(frame, text=sheet, variable=var).pack(anchor='w', pady=2)
+            self.sheet_vars[sheet] = var
         ctk.CTkButton(self, text="OK", command=self.on_ok).pack(pady=10)
 
     def on_ok(self):
-        selected_sheet = self.sheet_var.get()
-        self.callback(selected_sheet)
+        selected_sheets = [sheet for sheet, var in self.sheet_vars.items() if var.get()]
+        if not selected_sheets:
+            messagebox.showerror("Erreur", "Aucune feuille sélectionnée.", parent=self)
+            return
+        self.callback(selected_sheets)
         self.destroy()
 
 class ChartSelectionDialog(ctk.CTkToplevel):
-    def __init__(self, parent, columns, callback):
+    def __init__(self, parent, columns, callback, profiles=None):
+        from reports import DISPLAY_TYPES, DEFAULT_DISPLAY_TYPE, default_chart_type, eligible_chart_types
         super().__init__(parent)
         self.title("Select Chart Types")
         self.geometry("400x400")
         self.chart_type_vars = {}
         self.display_type_vars = {}
         self.callback = callback
-        chart_types = ['Pie Chart', 'Bar Chart', 'Line Chart', 'Scatter Plot']
-        display_types = ['%', 'Nombre']
         frame = ctk.CTkFrame(self)
         frame.pack(pady=10, padx=10, fill='both', expand=True)
 
+        profiles = profiles or {}
         for column in columns:
             if column not in self.chart_type_vars:
-                var = ctk.StringVar(value='Pie Chart')
-                display_var = ctk.StringVar(value='Nombre')
+                profile = profiles.get(column)
+                var = ctk.StringVar(value=default_chart_type(profile))
+                display_var = ctk.StringVar(value=DEFAULT_DISPLAY_TYPE)
                 row_frame = ctk.CTkFrame(frame)
                 row_frame.pack(anchor='w', fill='x')
                 ctk.CTkLabel(row_frame, text=column).pack(side='left', padx=10)
-                chart_type_menu = ctk.CTkOptionMenu(row_frame, variable=var, values=chart_types)
+                chart_type_menu = ctk.CTkOptionMenu(row_frame, variable=var, values=eligible_chart_types(profile))
                 chart_type_menu.pack(side='left')
-                display_type_menu = ctk.CTkOptionMenu(row_frame, variable=display_var, values=display_types)
+                display_type_menu = ctk.CTkOptionMenu(row_frame, variable=display_var, values=DISPLAY_TYPES)
                 display_type_menu.pack(side='left')
                 self.chart_type_vars[column] = var
                 self.display_type_vars[column] = display_var
@@ -91,12 +95,19 @@ class App(ctk.CTk):
     def __init__(self):
         super().__init__()
         self.df = None
+        self.aggregates = None
+        self.workbook = None
+        self.sheet_name = None
+        self.sheet_rows = None
+        self.workbook_paths = []
+        self.selected_sheets = []
         self.columns = []
-        self.column_vars = {}
         self.output_folder = ""
         self.config = load_config()
+        self.jobs = JobRunner(self)
+        configure((self.config or {}).get('spans_file'))
 
-        logging.info(f"Configuration loaded: {self.config}")
+        logging.info("Configuration loaded: %s", self.config)
 
         # Configure window
         self.title('Linkgraph')
@@ -116,11 +127,11 @@ class App(ctk.CTk):
         self.bottom_frame = ctk.CTkFrame(self, corner_radius=0)
         self.bottom_frame.grid(row=2, column=0, columnspan=4, sticky="ew", padx=10, pady=10)
 
-        logo_path = os.path.join(sys._MEIPASS, "images", "icon_app.png") if getattr(sys, 'frozen', False) else "images/icon_app.png"
-        logging.info(f"Logo path: {logo_path}")
+        # Shipped at display size, no resampling at startup.
+        logo_path = resource_path("images", "icon_app_50.png")
+        logging.info("Logo path: %s", logo_path)
 
         logo_image = Image.open(logo_path)
-        logo_image = logo_image.resize((50, 50), Resampling.LANCZOS)
         logo_ctk_image = ctk.CTkImage(light_image=logo_image, size=(50, 50))
         logo_label = ctk.CTkLabel(self.top_frame, image=logo_ctk_image, text="")
         logo_label.grid(row=0, column=0, padx=10)
@@ -132,79 +143,150 @@ class App(ctk.CTk):
         appearance_menu = ctk.CTkOptionMenu(self.top_frame, variable=appearance_mode_var, values=["Light", "Dark"], fg_color="#0078D4", command=self.change_appearance_mode)
         appearance_menu.grid(row=0, column=3, padx=10)
 
-        self.columns_canvas = ctk.CTkCanvas(self.middle_frame)
-        self.columns_frame = ctk.CTkFrame(self.columns_canvas)
-        self.vsb = ctk.CTkScrollbar(self.middle_frame, command=self.columns_canvas.yview)
-        self.columns_canvas.configure(yscrollcommand=self.vsb.set)
-        self.vsb.pack(side="right", fill="y")
-        self.columns_canvas.pack(side="left", fill="both", expand=True)
-        self.columns_canvas.create_window((4, 4), window=self.columns_frame, anchor="nw", tags="self.columns_frame")
-        self.columns_frame.bind("<Configure>", self.on_frame_configure)
+        self.column_list = ColumnList(self.middle_frame)
+        self.column_list.pack(fill="both", expand=True)
 
         buttons_frame = ctk.CTkFrame(self.bottom_frame)
         buttons_frame.pack(pady=10)
 
-        ctk.CTkButton(buttons_frame, text="Generer le rappport", command=self.show_chart_selection_dialog, fg_color="#2B2171", text_color="#FFF6E9").pack(side='left', padx=5)
-        ctk.CTkButton(buttons_frame, text="Generer la carte interactive", command=self.generate_map, fg_color="#2B2171", text_color="#FFF6E9").pack(side='left', padx=5)
+        self.report_button = ctk.CTkButton(buttons_frame, text="Generer le rappport", command=self.show_chart_selection_dialog, fg_color="#2B2171", text_color="#FFF6E9")
+        self.report_button.pack(side='left', padx=5)
+        self.map_button = ctk.CTkButton(buttons_frame, text="Generer la carte interactive", command=self.generate_map, fg_color="#2B2171", text_color="#FFF6E9")
+        self.map_button.pack(side='left', padx=5)
 
         self.generate_pdf_var = BooleanVar(value=False)
         ctk.CTkCheckBox(buttons_frame, text="Générer un rapport PDF", variable=self.generate_pdf_var).pack(side='left', padx=5)
+        self.combined_var = BooleanVar(value=False)
+        ctk.CTkCheckBox(buttons_frame, text="Rapport et carte combinés", variable=self.combined_var).pack(side='left', padx=5)
+
+        progress_frame = ctk.CTkFrame(self.bottom_frame)
+        progress_frame.pack(fill='x', pady=5)
+        self.progress_bar = ctk.CTkProgressBar(progress_frame)
+        self.progress_bar.set(0)
+        self.progress_bar.pack(side='left', fill='x', expand=True, padx=5)
+        self.status_label = ctk.CTkLabel(progress_frame, text="")
+        self.status_label.pack(side='left', padx=5)
+        self.cancel_button = ctk.CTkButton(progress_frame, text="Annuler", command=self.jobs.cancel, fg_color="#EA504C", state="disabled", width=80)
+        self.cancel_button.pack(side='left', padx=5)
 
         ctk.CTkLabel(self.top_frame, text=f"Version: {APP_VERSION}").grid(row=0, column=4, padx=10)
 
         self.update_text_colors()
+        self.after_idle(lambda: threading.Thread(target=preload, name="linkgraph-preload", daemon=True).start())
 
     def open_file(self):
-        file_path = filedialog.askopenfilename(title="Choisir le Fichier Excel", filetypes=[("Excel files", "*.xlsx *.xls *.xlsm")])
-        if file_path:
+        if self.jobs.busy:
+            messagebox.showwarning("Linkgraph", "Une génération est déjà en cours.")
+            return
+        # Several workbooks, or several sheets, are analysed as one batch.
+        file_paths = filedialog.askopenfilenames(title="Choisir le Fichier Excel", filetypes=[("Excel files", "*.xlsx *.xls *.xlsm")])
+        if file_paths:
+            from ingest import open_workbook
             try:
-                xls = pd.ExcelFile(file_path)
-                if len(xls.sheet_names) > 1:
-                    SheetSelectionDialog(self, xls.sheet_names, lambda sheet: self.load_data(file_path, sheet))
+                if self.workbook is not None:
+                    self.workbook.close()
+                self.workbook_paths = list(file_paths)
+                self.workbook = open_workbook(self.workbook_paths[0], self.config)
+                sheet_names = self.workbook.sheet_names
+                if len(sheet_names) > 1:
+                    SheetSelectionDialog(self, sheet_names, self.load_sheets)
                 else:
-                    self.load_data(file_path, xls.sheet_names[0])
+                    self.load_sheets(sheet_names[:1])
             except Exception as e:
-                logging.error(f"Error loading Excel file: {e}")
+                logging.error("Error loading Excel file: %s", e)
                 messagebox.showerror("Error", f"Failed to load file: {str(e)}")
 
-    def load_data(self, file_path, sheet_name):
+    def load_sheets(self, sheet_names):
+        # Columns are listed from the first sheet, the selection applies to all.
+        self.selected_sheets = sheet_names
+        self.load_data(sheet_names[0])
+
+    def is_batch(self):
+        return len(self.workbook_paths) > 1 or len(self.selected_sheets) > 1
+
+    def batch_targets(self):
+        from engine import list_targets
+        if len(self.selected_sheets) == 1 and self.selected_sheets[0] == self.workbook.sheet_names[0]:
+            # Only the default sheet is selected, use the first sheet of every workbook.
+            return list_targets(self.workbook_paths)
+        return list_targets(self.workbook_paths, self.selected_sheets, config=self.config)
+
+    def load_data(self, sheet_name):
         try:
-            self.df = pd.read_excel(file_path, sheet_name=sheet_name)
-            self.columns = [col for col in self.df.columns if not col.startswith('Unnamed')]
-            logging.info(f"File loaded: {file_path}")
-            logging.info(f"Columns: {self.columns}")
-            if self.df is not None:
-                for widget in self.columns_frame.winfo_children():
-                    widget.destroy()
-                self.column_vars = {}
-                for column in self.columns:
-                    if column:
-                        var = IntVar()
-                        chk = ctk.CTkCheckBox(self.columns_frame, text=column, variable=var, fg_color="#0078D4")
-                        chk.pack(anchor='w')
-                        self.column_vars[column] = var
-                self.update_text_colors()
+            sheet_info = self.workbook.inspect_sheet(sheet_name)
+            self.sheet_name = sheet_name
+            self.sheet_rows = sheet_info["rows"]
+            self.df = None
+            self.aggregates = None
+            self.columns = [col for col in sheet_info["columns"] if not col.startswith('Unnamed')]
+            logging.info("File loaded: %s (%s rows)", self.workbook.file_path, sheet_info['rows'])
+            logging.info("Columns: %s", self.columns)
+            self.column_list.set_columns([column for column in self.columns if column])
         except Exception as e:
-            logging.error(f"Error loading Excel sheet: {e}")
+            logging.error("Error loading Excel sheet: %s", e)
             messagebox.showerror("Error", f"Failed to load sheet: {str(e)}")
 
+    def is_streaming(self):
+        from engine import streaming_enabled
+        return streaming_enabled(self.sheet_rows, self.config)
+
+    def run_streaming_job(self, job, progress=None, cancel=None):
+        # Too large to load, run_job aggregates the sheet chunk by chunk.
+        from engine import run_job
+        result = run_job(self.workbook.file_path, self.sheet_name, job, self.config, self.output_folder,
+                         progress=progress, cancel=cancel)
+        return dict(result, charts=[(chart["column"], chart["path"], None) for chart in result["charts"]])
+
+    def load_columns(self, columns):
+        from aggregates import ColumnAggregates
+        from column_profile import detect_gps_columns
+        from ingest import compact_frame
+        lat_col, lon_col = detect_gps_columns(self.columns)
+        wanted = list(dict.fromkeys(columns + [column for column in (lat_col, lon_col) if column]))
+        if self.df is None or not set(wanted) <= set(self.df.columns):
+            self.df = self.workbook.read_sheet(self.sheet_name, wanted)
+            if self.config.get('compact_dataframes', True):
+                self.df = compact_frame(self.df, (lat_col, lon_col))
+            self.aggregates = ColumnAggregates(self.df)
+            logging.info("Columns loaded: %s", list(self.df.columns))
+        return self.df
+
     def select_output_folder(self):
         folder_selected = filedialog.askdirectory()
         if folder_selected:
             self.output_folder = folder_selected
-            logging.info(f"Output folder selected: {self.output_folder}")
+            logging.info("Output folder selected: %s", self.output_folder)
 
     def show_chart_selection_dialog(self):
-        selected_columns = [column for column, var in self.column_vars.items() if var.get() == 1]
-        logging.info(f"Selected columns: {selected_columns}")
+        selected_columns = self.column_list.selected_columns()
+        logging.info("Selected columns: %s", selected_columns)
         if not selected_columns:
             messagebox.showerror("Erreur", "Aucune colonne sélectionnée.")
             return
-        ChartSelectionDialog(self, selected_columns, self.set_column_chart_pairs)
+        if self.is_streaming():
+            ChartSelectionDialog(self, selected_columns, self.set_column_chart_pairs)
+            return
+        # Chart types offered depend on the data, load and profile it first.
+        self.start_job("load", self.run_profile_job, selected_columns, on_done=self.on_profile_done)
+
+    def run_profile_job(self, columns, progress=None, cancel=None):
+        try:
+            self.load_columns(columns)
+        except Exception as e:
+            logging.error("Error loading Excel sheet: %s", e)
+            return {"errors": [{"stage": "load", "message": f"Failed to load sheet: {str(e)}"}]}
+        profiles = self.aggregates.profiles()
+        return {"columns": columns, "profiles": {column: profiles[column] for column in columns}, "errors": []}
+
+    def on_profile_done(self, result):
+        if result["errors"]:
+            messagebox.showerror("Error", "\n".join(error["message"] for error in result["errors"]))
+            return
+        ChartSelectionDialog(self, result["columns"], self.set_column_chart_pairs, result["profiles"])
 
     def set_column_chart_pairs(self, column_chart_pairs):
         self.column_chart_pairs = column_chart_pairs
-        logging.info(f"Column chart pairs: {self.column_chart_pairs}")
+        logging.info("Column chart pairs: %s", self.column_chart_pairs)
         self.generate_report()
 
     def generate_report(self):
@@ -218,30 +300,112 @@ class App(ctk.CTk):
             messagebox.showerror("Error", "Configuration not loaded.")
             return
 
-        logging.info(f"Starting to generate charts for columns: {self.column_chart_pairs}")
-
-        # Generate charts
-        charts = list(generate_charts(self.df, self.column_chart_pairs, self.config, self.output_folder))
-
-        logging.info(f"Charts generated: {charts}")
+        logging.info("Starting to generate charts for columns: %s", self.column_chart_pairs)
+        if self.is_batch():
+            job = {"charts": self.column_chart_pairs, "pdf": self.generate_pdf_var.get(), "map": False, "map_columns": None}
+            self.start_job("batch", self.run_batch_job, job, self.combined_var.get(), on_done=self.on_batch_done)
+            return
+        self.start_job("report", self.run_report_job, self.column_chart_pairs, self.generate_pdf_var.get(), on_done=self.on_report_done)
 
-        # Create PDF report if the option is selected
-        if self.generate_pdf_var.get():
-            create_pdf_report(self.config, charts, self.output_folder)
-            messagebox.showinfo("Success", "PDF file has been generated successfully.")
+    def run_report_job(self, column_chart_pairs, pdf, progress=None, cancel=None):
+        from engine import run_report
+        if self.is_streaming():
+            job = {"charts": column_chart_pairs, "pdf": pdf, "map": False, "map_columns": None}
+            return self.run_streaming_job(job, progress, cancel)
+        try:
+            df = self.load_columns([column for column, _, _ in column_chart_pairs])
+        except Exception as e:
+            logging.error("Error loading Excel sheet: %s", e)
+            return {"charts": [], "pdf": None, "errors": [{"stage": "load", "message": f"Failed to load sheet: {str(e)}"}]}
+        return run_report(df, column_chart_pairs, self.config, self.output_folder, pdf=pdf, aggregates=self.aggregates,
+                          progress=progress, cancel=cancel)
+
+    def on_report_done(self, result):
+        logging.info("Charts generated: %s", [(column, path) for column, path, _ in result.get('charts', [])])
+        if result["errors"]:
+            messagebox.showerror("Error", "\n".join(error["message"] for error in result["errors"]))
+        elif result["pdf"]:
+            messagebox.showinfo("Success", f"PDF file has been generated successfully: {result['pdf']}")
         else:
             messagebox.showinfo("Success", "Charts have been generated successfully without PDF.")
 
     def generate_map(self):
-        lat_col, lon_col = detect_gps_columns(self.df)
-        if lat_col and lon_col:
-            additional_columns = [column for column, var in self.column_vars.items() if var.get() == 1 and column not in [lat_col, lon_col]]
-            generate_interactive_map(self.df, lat_col, lon_col, additional_columns, self.output_folder)
+        if self.workbook is None:
+            messagebox.showerror("Error", "Please open an Excel file first.")
+            return
+        selected_columns = self.column_list.selected_columns()
+        if self.is_batch():
+            if not self.output_folder:
+                messagebox.showerror("Error", "Please select an output folder first.")
+                return
+            job = {"charts": [], "pdf": False, "map": True, "map_columns": selected_columns}
+            self.start_job("batch", self.run_batch_job, job, self.combined_var.get(), on_done=self.on_batch_done)
+            return
+        self.start_job("map", self.run_map_job, selected_columns, on_done=self.on_map_done)
+
+    def run_map_job(self, selected_columns, progress=None, cancel=None):
+        from engine import run_map
+        if self.is_streaming():
+            job = {"charts": [], "pdf": False, "map": True, "map_columns": selected_columns}
+            return self.run_streaming_job(job, progress, cancel)
+        try:
+            df = self.load_columns(selected_columns)
+        except Exception as e:
+            logging.error("Error loading Excel sheet: %s", e)
+            return {"map": None, "errors": [{"stage": "load", "message": f"Failed to load sheet: {str(e)}"}]}
+        return run_map(df, selected_columns, self.output_folder, self.config, self.aggregates, progress=progress, cancel=cancel)
+
+    def on_map_done(self, result):
+        if result["errors"]:
+            messagebox.showerror("Error", "\n".join(error["message"] for error in result["errors"]))
         else:
-            messagebox.showerror("Error", "latitude ou longitude non trouvée.")
+            messagebox.showinfo("Success", f"Interactive map has been generated successfully: {result['map']}")
+
+    def run_batch_job(self, job, combine, progress=None, cancel=None):
+        from engine import run_analysis, target_label
+        try:
+            targets = self.batch_targets()
+        except Exception as e:
+            logging.error("Error loading Excel file: %s", e)
+            return {"results": [], "errors": [{"stage": "load", "message": f"Failed to load file: {str(e)}"}]}
+        logging.info("Batch targets: %s", targets)
+        analysis = run_analysis(targets, job, self.config, self.output_folder, combine, progress=progress, cancel=cancel)
+        errors = [{"stage": error["stage"], "message": f"{target_label(result['workbook'], result['sheet'])}: {error['message']}"}
+                  for result in analysis["results"] for error in result["errors"]]
+        if "combined" in analysis:
+            errors.extend(analysis["combined"]["errors"])
+        return dict(analysis, errors=errors)
+
+    def on_batch_done(self, result):
+        if result["errors"]:
+            messagebox.showerror("Error", "\n".join(error["message"] for error in result["errors"]))
+        else:
+            messagebox.showinfo("Success", f"{len(result['results'])} sheets have been processed in: {self.output_folder}")
+
+    def start_job(self, name, target, *args, on_done=None):
+        profile_file = (self.config or {}).get('profile_file')
+        def run(*args, **kwargs):
+            with profiled(profile_file):
+                return target(*args, **kwargs)
+        def done(result):
+            self.set_busy(False)
+            on_done(result)
+        if not self.jobs.submit(name, run, *args, on_progress=self.on_progress, on_done=done):
+            messagebox.showwarning("Linkgraph", "Une génération est déjà en cours.")
+            return
+        self.set_busy(True)
+
+    def set_busy(self, busy):
+        state = "disabled" if busy else "normal"
+        self.report_button.configure(state=state)
+        self.map_button.configure(state=state)
+        self.cancel_button.configure(state="normal" if busy else "disabled")
+        self.progress_bar.set(0)
+        self.status_label.configure(text="")
 
-    def on_frame_configure(self, event):
-        self.columns_canvas.configure(scrollregion=self.columns_canvas.bbox("all"))
+    def on_progress(self, done, total, label):
+        self.progress_bar.set(done / total if total else 0)
+        self.status_label.configure(text=f"{label} ({done}/{total})")
 
     def change_appearance_mode(self, new_mode):
         ctk.set_appearance_mode(new_mode)
@@ -264,8 +428,7 @@ class App(ctk.CTk):
         self.top_frame.configure(fg_color=bg_color)
         self.middle_frame.configure(fg_color=bg_color)
         self.bottom_frame.configure(fg_color=bg_color)
-        self.columns_canvas.configure(bg=bg_color)
-        self.columns_frame.configure(fg_color=bg_color)
+        self.column_list.configure(fg_color=bg_color)
 
         # Update button colors
         for button in self.bottom_frame.winfo_children():
@@ -281,10 +444,9 @@ class App(ctk.CTk):
         else:  # system
             text_color = "#000000"
 
-        for child in self.columns_frame.winfo_children():
-            if isinstance(child, ctk.CTkCheckBox):
-                child.configure(text_color=text_color)
+        self.column_list.set_text_color(text_color)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = App()
     app.mainloop()
@@ -1,102 +1,353 @@
+import importlib.util
+import io
 import logging
 import os
-import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime
-from tkinter import messagebox
+from matplotlib import rc_context
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import LinearSegmentedColormap, LogNorm, to_rgb
+from matplotlib.figure import Figure
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfgen import canvas as pdf_canvas
+from aggregates import ColumnAggregates
+from chart_cache import chart_key, load_manifest, update_manifest
+from downsample import density_grid
+from config import resource_path
+from instrument import span
+
+CHART_TYPES = ['Pie Chart', 'Bar Chart', 'Line Chart', 'Scatter Plot']
+DISPLAY_TYPES = ['%', 'Nombre']
+DEFAULT_CHART_TYPE = 'Pie Chart'
+DEFAULT_DISPLAY_TYPE = 'Nombre'
+# Numeric columns with more distinct values default to a Line Chart.
+MAX_PIE_CATEGORIES = 20
+CHART_FIGSIZE = (8, 6)
+DEFAULT_SCATTER_DENSITY_THRESHOLD = 50000
+CHART_FORMATS = ('png', 'svg', 'pdf')
+# Plot and colorbar columns of the density template.
+DENSITY_WIDTH_RATIOS = (30, 1)
+# No timestamps, an unchanged chart always gives the same bytes.
+FORMAT_METADATA = {'png': None, 'svg': {'Date': None}, 'pdf': {'CreationDate': None}}
+HAS_SVGLIB = importlib.util.find_spec("svglib") is not None
+# Fewer charts render faster in-process than through the worker processes.
+PARALLEL_CHART_MIN_JOBS = 4
+
+_templates = threading.local()
+_pool = {"executor": None, "workers": None}
+_pool_lock = threading.Lock()
 
 def load_data(file_path):
     try:
         df = pd.read_excel(file_path)
-        logging.info(f"Excel file {file_path} loaded successfully.")
+        logging.info("Excel file %s loaded successfully.", file_path)
         return df, df.columns.tolist()
     except Exception as e:
-        logging.error(f"Error loading Excel file: {e}")
-        messagebox.showerror("Error", f"Failed to load file: {str(e)}")
+        logging.error("Error loading Excel file: %s", e)
         return None, []
 
 def is_numeric_column(series):
     return pd.api.types.is_numeric_dtype(series)
 
-def generate_charts(df, column_chart_pairs, config, output_folder):
-    figsize = (8, 6)
-    logging.info(f"Generating charts for columns: {column_chart_pairs}")
+def eligible_chart_types(profile):
+    # Line and Scatter charts need numeric data.
+    if profile is None or profile["numeric"]:
+        return list(CHART_TYPES)
+    return ['Pie Chart', 'Bar Chart']
+
+def default_chart_type(profile):
+    if profile is not None and profile["numeric"] and profile["distinct"] > MAX_PIE_CATEGORIES:
+        return 'Line Chart'
+    return DEFAULT_CHART_TYPE
+
+def chart_file_path(output_folder, column, chart_format='png'):
+    return os.path.join(output_folder, f'{column.replace(" - ", "_").replace(" ", "_")}.{chart_format}')
+
+def resolve_chart_format(config, pdf=False):
+    # The PDF report embeds PNG charts, and SVG ones as vectors through svglib.
+    chart_format = config.get('chart_format') or 'png'
+    if chart_format not in CHART_FORMATS:
+        logging.warning("Unknown chart format %s, using png.", chart_format)
+        return 'png'
+    if pdf and chart_format != 'png' and not (chart_format == 'svg' and HAS_SVGLIB):
+        logging.warning("%s charts cannot be embedded in the PDF report (SVG needs svglib), using png.", chart_format)
+        return 'png'
+    return chart_format
+
+def prepare_chart(df, column, chart_type, display_type, column_chart_pairs, config, aggregates=None):
+    aggregates = aggregates or ColumnAggregates(df)
+    job = {"column": column, "chart_type": chart_type, "display_type": display_type, "colors": list(config['data_colors'])}
+    if chart_type in ('Pie Chart', 'Bar Chart'):
+        value_counts = aggregates.value_counts(column)
+        job["labels"] = value_counts.index.tolist()
+        job["values"] = value_counts.to_numpy()
+        job["total"] = aggregates.total(column)
+        if chart_type == 'Bar Chart' and display_type == '%':
+            job["percentages"] = aggregates.percentages(column).to_numpy()
+    elif chart_type == 'Line Chart':
+        if aggregates.is_numeric(column):
+            job["x"], job["y"] = aggregates.line_points(column)
+    elif chart_type == 'Scatter Plot':
+        other_columns = [col for col in aggregates.numeric_columns([col for col, _, _ in column_chart_pairs]) if col != column]
+        if other_columns:
+            job["xlabel"] = other_columns[0]
+            threshold = config.get('scatter_density_threshold', DEFAULT_SCATTER_DENSITY_THRESHOLD)
+            x, y = aggregates.scatter_points(other_columns[0], column)
+            if threshold and aggregates.rows > threshold:
+                job["density"], job["xedges"], job["yedges"] = density_grid(x, y)
+                if len(x) < aggregates.rows:
+                    # Streamed sheets only keep a row sample, scale it back up.
+                    job["density"] = job["density"] * (aggregates.rows / len(x))
+            else:
+                job["x"], job["y"] = x, y
+    return job
+
+def render_chart(job):
+    with span("chart_render", column=job["column"], chart_type=job["chart_type"]):
+        return _draw_chart(job)
+
+def chart_template(layout):
+    # Every thread builds one figure per layout and keeps it: later charts
+    # only replace the data artists, the axes, ticks and fonts are reused.
+    # Constrained layout fits legends and labels in the figure as it draws,
+    # without the second render of a tight bbox.
+    templates = getattr(_templates, 'figures', None)
+    if templates is None:
+        templates = _templates.figures = {}
+    if layout not in templates:
+        fig = Figure(figsize=CHART_FIGSIZE, layout='constrained')
+        FigureCanvasAgg(fig)
+        if layout == 'Density':
+            ax, cax = fig.subplots(1, 2, width_ratios=DENSITY_WIDTH_RATIOS)
+        else:
+            ax, cax = fig.add_subplot(), None
+        templates[layout] = (fig, ax, cax)
+        return templates[layout]
+    fig, ax, cax = templates[layout]
+    for artist in [*ax.lines, *ax.patches, *ax.collections, *ax.texts, *ax.images]:
+        artist.remove()
+    if ax.get_legend() is not None:
+        ax.get_legend().remove()
+    ax.set_xlabel('')
+    ax.set_ylabel('')
+    ax.relim()
+    ax.set_autoscale_on(True)
+    # Constrained layout starts from the current positions, reset them so
+    # the previous chart does not shift this one.
+    for axes in filter(None, (ax, cax)):
+        axes.set_subplotspec(axes.get_subplotspec())
+    return fig, ax, cax
+
+def _draw_chart(job):
+    column, chart_type, display_type, colors = job["column"], job["chart_type"], job["display_type"], job["colors"]
+    fig, ax, cax = chart_template('Density' if "density" in job else chart_type)
+    if chart_type == 'Pie Chart':
+        values = job["values"]
+        total = job["total"]
+        if len(values) and total > 0:
+            if display_type == '%':
+                ax.pie(values, autopct='%1.1f%%', startangle=90, colors=colors[:len(values)])
+            else:
+                ax.pie(values, autopct=lambda p: f'{int(p * total / 100)}', startangle=90, colors=colors[:len(values)])
+            ax.legend(job["labels"], title="Categories", loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
+            ax.axis('equal')
+        else:
+            # As after a pie, whatever the template drew before.
+            ax.set(frame_on=False, xticks=[], yticks=[])
+    elif chart_type == 'Bar Chart':
+        values = job["values"]
+        positions = range(len(values))
+        ax.bar(positions, values, width=0.5, color=colors)
+        ax.set_xticks(positions, [str(label) for label in job["labels"]], rotation=45)
+        ax.set_ylabel('Count' if display_type == 'Nombre' else 'Percentage')
+        ax.set_xlabel(column)
+        # Headroom for the percentages above the tallest bar.
+        ax.margins(y=0.1)
+        if display_type == '%':
+            for i, (value, percentage) in enumerate(zip(values, job["percentages"])):
+                ax.annotate(f'{percentage:.1f}%', (i, value), xytext=(0, 2), textcoords='offset points', ha='center', va='bottom')
+    elif chart_type == 'Line Chart':
+        if "y" in job:
+            ax.plot(job["x"], job["y"], color=colors[0])
+            ax.set_ylabel(column)
+            ax.set_xlabel('Index')
+    elif chart_type == 'Scatter Plot':
+        if "density" in job:
+            counts = np.ma.masked_equal(job["density"], 0)
+            # Lone points must stay visible, start the scale at a tint of the colour.
+            tint = 0.3 * np.array(to_rgb(colors[0])) + 0.7
+            cmap = LinearSegmentedColormap.from_list("density", [tint, colors[0]])
+            mesh = ax.pcolormesh(job["xedges"], job["yedges"], counts, cmap=cmap,
+                                 norm=LogNorm(vmin=1, vmax=max(counts.max(), 1)), rasterized=True)
+            # Pointing the colorbar at the new mesh keeps its log ticks, a new
+            # colorbar would rebuild them.
+            colorbar = getattr(_templates, 'colorbar', None)
+            if colorbar is None:
+                _templates.colorbar = fig.colorbar(mesh, cax=cax, label='Points')
+            else:
+                colorbar.update_normal(mesh)
+            ax.set_xlabel(job["xlabel"])
+            ax.set_ylabel(column)
+        elif "y" in job:
+            ax.scatter(job["x"], job["y"], color=colors[0])
+            ax.set_xlabel(job["xlabel"])
+            ax.set_ylabel(column)
+    chart_format = job.get("format", 'png')
+    buffer = io.BytesIO()
+    # SVG ids are random unless salted.
+    with rc_context({'svg.hashsalt': 'linkgraph'}):
+        fig.savefig(buffer, format=chart_format, metadata=FORMAT_METADATA[chart_format])
+    return buffer.getvalue()
+
+def _chart_pool(workers):
+    # One pool for the whole process, kept between reports so each one does
+    # not pay for starting the workers again.
+    with _pool_lock:
+        if _pool["executor"] is None or _pool["workers"] != workers:
+            if _pool["executor"] is not None:
+                _pool["executor"].shutdown(wait=False)
+            _pool["executor"] = ProcessPoolExecutor(max_workers=workers)
+            _pool["workers"] = workers
+        return _pool["executor"]
+
+def _discard_pool(executor):
+    with _pool_lock:
+        if _pool["executor"] is executor:
+            _pool["executor"] = None
+    executor.shutdown(wait=False)
+
+def _render_charts(jobs, workers):
+    if workers and workers > 1 and len(jobs) >= PARALLEL_CHART_MIN_JOBS:
+        executor = _chart_pool(workers)
+        try:
+            yield from executor.map(render_chart, jobs)
+        except BrokenProcessPool:
+            # A dead worker breaks the whole pool, the next report starts a new one.
+            _discard_pool(executor)
+            raise
+    else:
+        for job in jobs:
+            yield render_chart(job)
+
+def plan_charts(df, column_chart_pairs, config, output_folder, aggregates=None, chart_cache=None, save_png=True, chart_format='png'):
+    aggregates = aggregates or ColumnAggregates(df)
+    jobs = []
     for column, chart_type, display_type in column_chart_pairs:
-        logging.info(f"Processing column: {column}, Chart type: {chart_type}, Display type: {display_type}")
-        if column in df.columns:
-            value_counts = df[column].value_counts()
-            plt.figure(figsize=figsize)
-            if chart_type == 'Pie Chart':
-                if not value_counts.empty and value_counts.sum() > 0:
-                    if display_type == '%':
-                        plt.pie(value_counts, autopct='%1.1f%%', startangle=90, colors=config['data_colors'][:len(value_counts)])
-                    else:
-                        plt.pie(value_counts, autopct=lambda p: f'{int(p * sum(value_counts) / 100)}', startangle=90, colors=config['data_colors'][:len(value_counts)])
-                    plt.legend(value_counts.index, title="Categories", loc="center left", bbox_to_anchor=(1, 0, 0.5, 1))
-                    plt.axis('equal')
-            elif chart_type == 'Bar Chart':
-                value_counts.plot(kind='bar', color=config['data_colors'])
-                plt.ylabel('Count' if display_type == 'Nombre' else 'Percentage')
-                plt.xlabel(column)
-                plt.xticks(rotation=45)
-                if display_type == '%':
-                    total = value_counts.sum()
-                    for i, value in enumerate(value_counts):
-                        plt.text(i, value + 1, f'{(value / total) * 100:.1f}%', ha='center')
-            elif chart_type == 'Line Chart':
-                if is_numeric_column(df[column]):
-                    df[column].plot(kind='line', color=config['data_colors'][0])
-                    plt.ylabel(column)
-                    plt.xlabel('Index')
-            elif chart_type == 'Scatter Plot':
-                other_columns = [col for col, _, _ in column_chart_pairs if col != column and is_numeric_column(df[col])]
-                if other_columns:
-                    plt.scatter(df[other_columns[0]], df[column], color=config['data_colors'][0])
-                    plt.xlabel(other_columns[0])
-                    plt.ylabel(column)
-            img_file_path = os.path.join(output_folder, f'{column.replace(" - ", "_").replace(" ", "_")}.png')
-            plt.savefig(img_file_path, bbox_inches='tight')
-            plt.close()
-            logging.info(f"{chart_type} generated for column {column}: {img_file_path}")
-            yield column, img_file_path
+        logging.info("Processing column: %s, Chart type: %s, Display type: %s", column, chart_type, display_type)
+        if not aggregates.has_column(column):
+            logging.warning("Column %s not found in the DataFrame.", column)
+        elif chart_type not in eligible_chart_types(aggregates.profile(column)):
+            logging.warning("%s skipped, column %s is not numeric.", chart_type, column)
+        else:
+            jobs.append(dict(prepare_chart(df, column, chart_type, display_type, column_chart_pairs, config, aggregates), format=chart_format))
+
+    # Decide per chart whether the file in the output folder is still current,
+    # can be copied from the chart cache or has to be rendered.
+    produced = {entry["path"]: entry["key"] for entry in load_manifest(output_folder).get("charts", []) if entry.get("path")}
+    entries = []
+    for job in jobs:
+        key = chart_key(job, config)
+        img_file_path = chart_file_path(output_folder, job["column"], chart_format) if save_png else None
+        if save_png and produced.get(img_file_path) == key and os.path.exists(img_file_path):
+            source = "reused"
+        elif chart_cache is not None and os.path.exists(chart_cache.path(key, chart_format)):
+            source = "cached"
         else:
-            logging.warning(f"Column {column} not found in the DataFrame.")
+            source = "rendered"
+        produced[img_file_path] = key
+        entries.append({"column": job["column"], "chart_type": job["chart_type"], "display_type": job["display_type"],
+                        "key": key, "path": img_file_path, "source": source})
+    return jobs, entries
+
+def generate_charts(df, column_chart_pairs, config, output_folder, workers=None, aggregates=None, chart_cache=None, save_png=True, plan=None, chart_format='png'):
+    logging.info("Generating charts for columns: %s", column_chart_pairs)
+    jobs, entries = plan or plan_charts(df, column_chart_pairs, config, output_folder, aggregates, chart_cache, save_png, chart_format)
+    rendered = _render_charts([job for job, entry in zip(jobs, entries) if entry["source"] == "rendered"], workers)
+    for job, entry in zip(jobs, entries):
+        image = None
+        if entry["source"] == "cached":
+            image = chart_cache.get(entry["key"], job["format"])
+            if image is None:
+                image = render_chart(job)
+                entry["source"] = "rendered"
+        elif entry["source"] == "rendered":
+            image = next(rendered)
+            if chart_cache is not None:
+                chart_cache.put(entry["key"], image, job["format"])
+        if image is not None and entry["path"]:
+            with span("chart_save", column=job["column"], path=entry["path"]), open(entry["path"], 'wb') as img_file:
+                img_file.write(image)
+        logging.info("%s %s for column %s: %s", job['chart_type'], entry['source'], job['column'], entry['path'])
+        yield job["column"], entry["path"], image
+    update_manifest(output_folder, charts=entries)
 
 
 def create_pdf_report(config, charts, output_folder):
+    now = datetime.now()
+    pdf_file_path = os.path.join(output_folder, f'Rapport_Analyse_{now.strftime("%Y_%m_%d")}.pdf')
+    logging.info("Creating PDF report at: %s", pdf_file_path)
+    logo_path = resource_path(config.get('logo_path', os.path.join("images", "logo.png")))
+    footer = f"Date de création : {now.strftime('%Y-%m-%d %H:%M:%S')}"
     try:
-        pdf_file_path = os.path.join(output_folder, f'Rapport_Analyse_{datetime.now().strftime("%Y_%m_%d")}.pdf')
-        logging.info(f"Creating PDF report at: {pdf_file_path}")
         c = pdf_canvas.Canvas(pdf_file_path, pagesize=letter)
         width, height = letter
-        for header, img_file_path in charts:
-            if not os.path.exists(img_file_path):
-                logging.error(f"Image file does not exist: {img_file_path}")
+        img_width, img_height = 8 * inch, 6 * inch
+        title_y_position = height - 1.5 * inch
+        image_x = (width - img_width) / 2
+        image_y = (height - img_height) / 2
+
+        # The logo is decoded and embedded once, every page references the form.
+        c.beginForm("logo")
+        c.drawImage(logo_path, inch * 0.5, inch * 0.5, width=1 * inch, height=0.5 * inch, preserveAspectRatio=True)
+        c.endForm()
+
+        for header, img_file_path, image in charts:
+            if image is None and img_file_path and os.path.exists(img_file_path):
+                with open(img_file_path, 'rb') as img_file:
+                    image = img_file.read()
+            if image is None:
+                logging.error("Image file does not exist: %s", img_file_path)
                 continue
-            logging.info(f"Adding chart to PDF: {header} from {img_file_path}")
-            img_width, img_height = 8 * inch, 6 * inch
-            title_y_position = height - 1.5 * inch
-            image_x = (width - img_width) / 2
-            image_y = (height - img_height) / 2
-            c.setFont("Helvetica-Bold", 18)
-            c.setFillColor(config['color_title'])
-            c.drawCentredString(width / 2, title_y_position, header)
-            c.drawImage(img_file_path, image_x, image_y, width=img_width, height=img_height, preserveAspectRatio=True)
-            logo_path = os.path.join(sys._MEIPASS, "images", "logo.png") if getattr(sys, 'frozen', False) else "images/logo.png"
-            c.drawImage(logo_path, inch * 0.5, inch * 0.5, width=1 * inch, height=0.5 * inch, preserveAspectRatio=True)
-            c.setFont("Helvetica", 9)
-            c.setFillColor(config['color_text'])
-            c.drawString(2 * inch, inch * 0.25, f"Date de création : {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            c.showPage()
-        c.save()
-        logging.info(f"PDF report generated successfully: {pdf_file_path}")
-        messagebox.showinfo("Success", f"PDF file has been generated successfully: {pdf_file_path}")
+            if is_svg(image) and not HAS_SVGLIB:
+                logging.error("svglib is needed to add SVG chart %s to the PDF report.", header)
+                continue
+            logging.info("Adding chart to PDF: %s", header)
+            with span("pdf_page", column=header):
+                c.setFont("Helvetica-Bold", 18)
+                c.setFillColor(config['color_title'])
+                c.drawCentredString(width / 2, title_y_position, header)
+                _draw_image(c, image, image_x, image_y, img_width, img_height)
+                c.doForm("logo")
+                c.setFont("Helvetica", 9)
+                c.setFillColor(config['color_text'])
+                c.drawString(2 * inch, inch * 0.25, footer)
+                c.showPage()
+        with span("pdf_save", path=pdf_file_path):
+            c.save()
     except Exception as e:
-        logging.error(f"Error generating PDF report: {e}")
-        messagebox.showerror("Error", f"Failed to generate PDF report: {str(e)}")
+        logging.error("Error generating PDF report: %s", e)
+        raise
+    logging.info("PDF report generated successfully: %s", pdf_file_path)
+    return pdf_file_path
+
+def is_svg(image):
+    return image.lstrip()[:5] in (b'<?xml', b'<svg ')
 
+def _draw_image(c, image, x, y, width, height):
+    if not is_svg(image):
+        c.drawImage(ImageReader(io.BytesIO(image)), x, y, width=width, height=height, preserveAspectRatio=True)
+        return
+    # Drawn as vectors, text and lines stay sharp at any zoom.
+    from reportlab.graphics import renderPDF
+    from svglib.svglib import svg2rlg
+    drawing = svg2rlg(io.BytesIO(image))
+    scale = min(width / drawing.width, height / drawing.height)
+    drawing.scale(scale, scale)
+    renderPDF.draw(drawing, c, x + (width - drawing.width * scale) / 2, y + (height - drawing.height * scale) / 2)
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+# Grid cells are a quarter of a 256px web map tile, i.e. ~64px at their zoom.
+CELLS_PER_TILE = 4
+MAX_LATITUDE = 85.0511
+# Zoom level of the grid used to split deep levels and raw points in files.
+CHUNK_ZOOM = 8
+
+
+def grid_cells(lats, lons, zoom):
+    n = (1 << zoom) * CELLS_PER_TILE
+    lat = np.radians(np.clip(np.asarray(lats, dtype=float), -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lons, dtype=float) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    cx = np.clip(np.floor(x * n), 0, n - 1).astype(np.int64)
+    cy = np.clip(np.floor(y * n), 0, n - 1).astype(np.int64)
+    return cx, cy
+
+def chunk_key(cx, cy):
+    return f'{cx}_{cy}'
+
+def build_cluster_pyramid(lats, lons, color_codes, n_colors, max_zoom, min_zoom=0):
+    level, color_columns = cluster_level(lats, lons, color_codes, n_colors, max_zoom)
+    return pyramid_levels(level, max_zoom, min_zoom), color_columns
+
+def cluster_level(lats, lons, color_codes, n_colors, zoom):
+    # Point count per colour and coordinate sums of every occupied cell. Levels
+    # of separate batches of points can be merged with add(fill_value=0).
+    cx, cy = grid_cells(lats, lons, zoom)
+    color_columns = [f'c{i}' for i in range(n_colors)]
+    points = pd.DataFrame({"cx": cx, "cy": cy, "lat": lats, "lon": lons})
+    for i, column in enumerate(color_columns):
+        points[column] = (np.asarray(color_codes) == i).astype(np.int64)
+    return points.groupby(["cx", "cy"]).sum(), color_columns
+
+def pyramid_levels(level, max_zoom, min_zoom=0):
+    levels = {}
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        if zoom < max_zoom:
+            # Parent cells are exactly the children's indices halved.
+            level = level.groupby([level.index.get_level_values(0) // 2, level.index.get_level_values(1) // 2]).sum()
+            level.index.names = ["cx", "cy"]
+        levels[zoom] = level.copy()
+    return levels
+
+def level_entries(level, color_columns):
+    counts = level[color_columns].to_numpy()
+    totals = counts.sum(axis=1)
+    lats = np.round(level["lat"].to_numpy() / totals, 6)
+    lons = np.round(level["lon"].to_numpy() / totals, 6)
+    return [[lat, lon, int(total), row] for lat, lon, total, row in zip(lats.tolist(), lons.tolist(), totals.tolist(), counts.tolist())]
+
+def split_by_chunk(level, zoom, color_columns, chunk_zoom=CHUNK_ZOOM):
+    shift = zoom - chunk_zoom
+    chunk_x = level.index.get_level_values(0).to_numpy() >> shift
+    chunk_y = level.index.get_level_values(1).to_numpy() >> shift
+    chunks = {}
+    for x, y, entry in zip(chunk_x.tolist(), chunk_y.tolist(), level_entries(level, color_columns)):
+        chunks.setdefault(chunk_key(x, y), []).append(entry)
+    return chunks
+
+def group_by_chunk(lats, lons, chunk_zoom=CHUNK_ZOOM):
+    cx, cy = grid_cells(lats, lons, chunk_zoom)
+    codes = cx * ((1 << chunk_zoom) * CELLS_PER_TILE) + cy
+    order = np.argsort(codes, kind='stable')
+    boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+    for rows in np.split(order, boundaries):
+        if len(rows):
+            yield chunk_key(cx[rows[0]], cy[rows[0]]), rows
@@ -0,0 +1,52 @@
+import unittest
+from unittest.mock import patch
+import pandas as pd
+from aggregates import ColumnAggregates, StreamingAggregates
+
+class TestColumnAggregates(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'FTTO': ['éligible', 'Non éligible', 'éligible', None],
+            'Debit': [10, 20, 30, 40]
+        })
+        self.aggregates = ColumnAggregates(self.df)
+
+    def test_value_counts_are_memoized(self):
+        with patch.object(pd.Series, 'value_counts', autospec=True, side_effect=pd.Series.value_counts) as mock_value_counts:
+            self.aggregates.value_counts('FTTO')
+            self.aggregates.total('FTTO')
+            self.aggregates.percentages('FTTO')
+        self.assertEqual(mock_value_counts.call_count, 1)
+        self.assertEqual(self.aggregates.total('FTTO'), 3)
+        self.assertListEqual(self.aggregates.percentages('FTTO').round(1).tolist(), [66.7, 33.3])
+
+    def test_numeric_columns(self):
+        self.assertListEqual(self.aggregates.numeric_columns(['FTTO', 'Debit', 'Missing']), ['Debit'])
+
+    def test_matching_values(self):
+        self.assertListEqual(self.aggregates.matching_values('FTTO', 'non éligible'), ['Non éligible'])
+        self.assertListEqual(sorted(self.aggregates.matching_values('FTTO', 'éligible')), ['Non éligible', 'éligible'])
+
+class TestStreamingAggregates(unittest.TestCase):
+    def test_chunks_give_the_same_statistics(self):
+        df = pd.DataFrame({
+            'FTTO': ['Non éligible', 'éligible', None, 'éligible', 'Sur devis', 'Non éligible', 'Sur devis'],
+            'Debit': [10, 20, 30, 40, 50, 60, 70],
+            'Latitude': [48.8, 45.7, 43.3, 50.6, 47.2, 44.8, 48.1],
+        })
+        aggregates = StreamingAggregates(df.columns, count_columns=['FTTO'], line_columns=['Debit'], sample_columns=['Debit', 'Latitude'])
+        for start in range(0, len(df), 3):
+            aggregates.update(df.iloc[start:start + 3])
+        expected = ColumnAggregates(df)
+        pd.testing.assert_series_equal(aggregates.value_counts('FTTO'), expected.value_counts('FTTO'), check_index_type=False)
+        self.assertEqual(aggregates.rows, 7)
+        self.assertListEqual(aggregates.numeric_columns(['FTTO', 'Debit', 'Latitude']), ['Debit', 'Latitude'])
+        for key in ('numeric', 'min', 'max', 'latitude_range', 'longitude_range', 'null_ratio'):
+            self.assertEqual(aggregates.profile('Latitude')[key], expected.profile('Latitude')[key], key)
+        self.assertAlmostEqual(aggregates.profile('FTTO')['null_ratio'], 1 / 7)
+        self.assertFalse(aggregates.profile('FTTO')['numeric'])
+        self.assertListEqual(aggregates.line_points('Debit')[1].tolist(), df['Debit'].tolist())
+        self.assertListEqual(aggregates.scatter_points('Debit', 'Latitude')[1].tolist(), df['Latitude'].tolist())
+
+if __name__ == '__main__':
+    unittest.main()
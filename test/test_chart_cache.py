@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import reports
+from chart_cache import ChartCache, chart_key, load_manifest
+
+CONFIG = {'data_colors': ['#76C5BC', '#48B77D', '#4BBABB']}
+
+class TestChartKey(unittest.TestCase):
+    def test_chart_key_depends_on_content_only(self):
+        job = {"column": "FTTO", "chart_type": "Pie Chart", "display_type": "%", "labels": ["a", "b"], "values": np.array([2, 1])}
+        same = {"values": np.array([2, 1]), "labels": ["a", "b"], "display_type": "%", "chart_type": "Pie Chart", "column": "FTTO"}
+        self.assertEqual(chart_key(job, CONFIG), chart_key(same, CONFIG))
+        self.assertNotEqual(chart_key(job, CONFIG), chart_key(dict(job, values=np.array([2, 2])), CONFIG))
+        self.assertNotEqual(chart_key(job, CONFIG), chart_key(job, {'data_colors': ['#000000']}))
+        self.assertNotEqual(chart_key(job, CONFIG), chart_key(dict(job, format='svg'), CONFIG))
+
+class TestChartCacheLimit(unittest.TestCase):
+    def test_least_recently_used_charts_are_pruned(self):
+        with tempfile.TemporaryDirectory() as folder:
+            chart_cache = ChartCache(folder, max_bytes=250)
+            for age, key in enumerate(['aa01', 'bb02']):
+                chart_cache.put(key, b'x' * 100)
+                os.utime(chart_cache.path(key), ns=(10 ** 18 + age, 10 ** 18 + age))
+            # Reading aa01 makes bb02 the least recently used chart.
+            self.assertIsNotNone(chart_cache.get('aa01'))
+            chart_cache.put('cc03', b'x' * 100)
+            self.assertIsNone(chart_cache.get('bb02'))
+            self.assertIsNotNone(chart_cache.get('aa01'))
+            self.assertIsNotNone(chart_cache.get('cc03'))
+
+class TestIncrementalCharts(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output_folder = os.path.join(self.tmp.name, 'out')
+        os.makedirs(self.output_folder)
+        self.chart_cache = ChartCache(os.path.join(self.tmp.name, 'charts'))
+        self.df = pd.DataFrame({'FTTO': ['éligible', 'Non éligible', 'éligible'], 'FTTH': ['éligible', 'éligible', 'Non éligible']})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_charts(self, pairs):
+        with patch('reports.render_chart', wraps=reports.render_chart) as mock_render:
+            charts = list(reports.generate_charts(self.df, pairs, CONFIG, self.output_folder, chart_cache=self.chart_cache))
+        return charts, mock_render.call_count
+
+    def test_only_changed_charts_are_rendered(self):
+        pairs = [('FTTO', 'Pie Chart', '%'), ('FTTH', 'Pie Chart', '%')]
+        _, rendered = self.run_charts(pairs)
+        self.assertEqual(rendered, 2)
+        _, rendered = self.run_charts(pairs)
+        self.assertEqual(rendered, 0)
+        _, rendered = self.run_charts([('FTTO', 'Pie Chart', '%'), ('FTTH', 'Bar Chart', '%')])
+        self.assertEqual(rendered, 1)
+        charts, rendered = self.run_charts(pairs)
+        self.assertEqual(rendered, 0)
+        sources = [entry['source'] for entry in load_manifest(self.output_folder)['charts']]
+        self.assertListEqual(sources, ['reused', 'cached'])
+        self.assertListEqual([path for _, path, _ in charts], [os.path.join(self.output_folder, 'FTTO.png'), os.path.join(self.output_folder, 'FTTH.png')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+from column_list import ColumnSelection
+
+class TestColumnSelection(unittest.TestCase):
+    def setUp(self):
+        self.model = ColumnSelection(['FTTO', 'FTTH - Statut', 'Latitude', 'Longitude', 'Débit FTTH'])
+
+    def test_filter_narrows_and_widens(self):
+        self.model.filter('ftt')
+        self.assertListEqual(list(self.model), ['FTTO', 'FTTH - Statut', 'Débit FTTH'])
+        self.model.filter('ftth')
+        self.assertListEqual(list(self.model), ['FTTH - Statut', 'Débit FTTH'])
+        self.model.filter('lo')
+        self.assertListEqual(list(self.model), ['Longitude'])
+        self.model.filter('')
+        self.assertEqual(len(self.model), 5)
+
+    def test_selection_survives_filtering(self):
+        self.model.set_checked('Longitude', True)
+        self.model.filter('ftt')
+        self.model.set_checked(self.model[0], True)
+        self.model.filter('')
+        self.assertListEqual(self.model.selected(), ['FTTO', 'Longitude'])
+        self.model.set_checked('FTTO', False)
+        self.assertListEqual(self.model.selected(), ['Longitude'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+import pandas as pd
+from column_profile import SAMPLE_ROWS, detect_gps_columns, profile_column, profile_frame
+
+class TestColumnProfile(unittest.TestCase):
+    def test_profile_column(self):
+        info = profile_column(pd.Series([48.85, 43.3, None, 45.76]))
+        self.assertTrue(info["numeric"])
+        self.assertEqual(info["distinct"], 3)
+        self.assertAlmostEqual(info["null_ratio"], 0.25)
+        self.assertEqual((info["min"], info["max"]), (43.3, 48.85))
+        self.assertTrue(info["latitude_range"])
+        text = profile_column(pd.Series(['éligible', 'Non éligible', 'éligible']))
+        self.assertFalse(text["numeric"])
+        self.assertEqual(text["distinct"], 2)
+        self.assertFalse(text["longitude_range"])
+
+    def test_wide_sheets_are_sampled(self):
+        df = pd.DataFrame(np.zeros((SAMPLE_ROWS * 3, 60)), columns=[f'c{i}' for i in range(60)])
+        profiles = profile_frame(df)
+        self.assertTrue(profiles['c0']["sampled"])
+        self.assertLessEqual(profiles['c0']["rows"], SAMPLE_ROWS)
+        self.assertFalse(profile_frame(df.iloc[:, :5])['c0']["sampled"])
+
+    def test_gps_names_match_whole_words_only(self):
+        self.assertEqual(detect_gps_columns(['Relation', 'Colonne', 'Lat', 'GPS X']), ('Lat', 'GPS X'))
+        self.assertEqual(detect_gps_columns(['Relation', 'Colonne']), (None, None))
+
+    def test_gps_values_must_be_wgs84(self):
+        df = pd.DataFrame({
+            'Latitude': [48.85, 43.3],
+            'Longitude Lambert': [652000.0, 6862000.0],
+            'Longitude': [2.35, 5.37],
+            'Lat (texte)': ['N48', 'N43'],
+        })
+        self.assertEqual(detect_gps_columns(df), ('Latitude', 'Longitude'))
+        self.assertEqual(detect_gps_columns(df[['Latitude', 'Longitude Lambert']]), ('Latitude', None))
+
+if __name__ == '__main__':
+    unittest.main()
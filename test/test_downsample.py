@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+from downsample import MinMaxAccumulator, ReservoirSample, density_grid, minmax_downsample
+
+class TestDownsample(unittest.TestCase):
+    def test_small_series_are_untouched(self):
+        x, y = minmax_downsample(np.arange(10), np.arange(10.0), buckets=5)
+        self.assertEqual(len(y), 10)
+
+    def test_minmax_keeps_extremes_in_order(self):
+        rng = np.random.default_rng(0)
+        y = rng.normal(size=100000)
+        y[12345] = 50.0
+        y[67890] = -50.0
+        x, small = minmax_downsample(np.arange(len(y)), y, buckets=100)
+        self.assertLessEqual(len(small), 400)
+        self.assertIn(12345, x)
+        self.assertIn(67890, x)
+        self.assertTrue(np.all(np.diff(x) > 0))
+        self.assertEqual((x[0], x[-1]), (0, len(y) - 1))
+        np.testing.assert_array_equal(small, y[x])
+
+    def test_minmax_handles_missing_values(self):
+        y = np.full(5000, np.nan)
+        y[:2500] = np.arange(2500)
+        x, small = minmax_downsample(np.arange(len(y)), y, buckets=100)
+        self.assertEqual(np.nanmax(small), 2499)
+        self.assertEqual(x[-1], 4999)
+
+    def test_density_grid_counts_finite_points(self):
+        counts, xedges, yedges = density_grid([0, 1, 1, np.nan], [0, 1, 1, 2], bins=(2, 2))
+        self.assertEqual(counts.sum(), 3)
+        self.assertEqual(counts[1, 1], 2)
+        self.assertEqual(len(xedges), 3)
+
+    def test_accumulator_matches_minmax_downsample(self):
+        rng = np.random.default_rng(1)
+        y = rng.normal(size=100000)
+        y[rng.random(len(y)) < 0.01] = np.nan
+        accumulator = MinMaxAccumulator(buckets=100, rows=len(y))
+        for start in range(0, len(y), 7000):
+            accumulator.add(y[start:start + 7000])
+        x, small = accumulator.result()
+        expected_x, expected_y = minmax_downsample(np.arange(len(y)), y, buckets=100)
+        np.testing.assert_array_equal(x, expected_x)
+        np.testing.assert_array_equal(small, expected_y)
+
+    def test_accumulator_stays_bounded_without_row_count(self):
+        accumulator = MinMaxAccumulator(buckets=100)
+        y = np.arange(100000.0)
+        for start in range(0, len(y), 5000):
+            accumulator.add(y[start:start + 5000])
+        x, small = accumulator.result()
+        self.assertLessEqual(len(x), 400)
+        self.assertEqual((x[0], x[-1]), (0, len(y) - 1))
+        np.testing.assert_array_equal(small, y[x])
+
+    def test_reservoir_keeps_everything_until_full(self):
+        sample = ReservoirSample(10, ['a', 'b'])
+        sample.add([[1, 2], [3, 4]])
+        sample.add([[5, 6]])
+        np.testing.assert_array_equal(sample.column('b'), [2, 4, 6])
+        for start in range(0, 1000, 100):
+            sample.add(np.column_stack([np.arange(start, start + 100), np.zeros(100)]))
+        self.assertEqual(len(sample.column('a')), 10)
+        self.assertEqual(sample.count, 1003)
+
+if __name__ == '__main__':
+    unittest.main()
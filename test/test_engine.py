@@ -0,0 +1,167 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+import openpyxl
+import pandas as pd
+from interactive_map import StreamingMap
+from engine import SOURCE_COLUMN, list_targets, parse_job, run_analysis, run_job, run_map, run_report, streaming_enabled, target_label, target_output_folder
+
+class TestParseJob(unittest.TestCase):
+    def test_parse_job_defaults(self):
+        job = parse_job({"columns": ["FTTO", {"column": "FTTH", "chart_type": "Bar Chart", "display_type": "%"}], "pdf": True})
+        self.assertListEqual(job["charts"], [("FTTO", "Pie Chart", "Nombre"), ("FTTH", "Bar Chart", "%")])
+        self.assertTrue(job["pdf"])
+        self.assertFalse(job["map"])
+
+    def test_parse_job_invalid_chart_type(self):
+        with self.assertRaises(ValueError):
+            parse_job({"columns": [{"column": "FTTO", "chart_type": "Radar"}]})
+
+class TestRunJob(unittest.TestCase):
+    def test_run_job_missing_workbook_returns_error(self):
+        job = parse_job({"columns": ["FTTO"]})
+        with tempfile.TemporaryDirectory() as output_folder:
+            result = run_job(os.path.join(output_folder, "missing.xlsx"), 0, job, {}, output_folder)
+        self.assertFalse(result["ok"])
+        self.assertEqual(result["errors"][0]["stage"], "load")
+
+    def test_run_map_without_gps_columns_returns_error(self):
+        df = pd.DataFrame({'FTTO': ['éligible']})
+        result = run_map(df, ['FTTO'], 'output_folder')
+        self.assertIsNone(result["map"])
+        self.assertEqual(result["errors"][0]["stage"], "map")
+
+    @patch('engine.generate_interactive_map', side_effect=ValueError("No valid coordinates found after removing missing values."))
+    def test_run_map_reports_map_errors(self, mock_generate):
+        df = pd.DataFrame({'Latitude': [None], 'Longitude': [None], 'FTTO': ['éligible']})
+        result = run_map(df, ['FTTO'], 'output_folder')
+        self.assertEqual(result["errors"], [{"stage": "map", "message": "No valid coordinates found after removing missing values."}])
+
+    def test_run_report_reuses_unchanged_pdf(self):
+        df = pd.DataFrame({'FTTO': ['éligible', 'Non éligible']})
+        config = {'data_colors': ['#76C5BC', '#48B77D'], 'chart_cache': False}
+        with tempfile.TemporaryDirectory() as output_folder:
+            pdf_file_path = os.path.join(output_folder, 'report.pdf')
+            def fake_pdf(config, charts, output_folder):
+                open(pdf_file_path, 'w').close()
+                return pdf_file_path
+            with patch('engine.create_pdf_report', side_effect=fake_pdf) as mock_pdf:
+                run_report(df, [('FTTO', 'Pie Chart', '%')], config, output_folder, pdf=True, chart_workers=1)
+                result = run_report(df, [('FTTO', 'Pie Chart', '%')], config, output_folder, pdf=True, chart_workers=1)
+                self.assertEqual(mock_pdf.call_count, 1)
+                run_report(df, [('FTTO', 'Bar Chart', '%')], config, output_folder, pdf=True, chart_workers=1)
+                self.assertEqual(mock_pdf.call_count, 2)
+        self.assertEqual(result["pdf"], pdf_file_path)
+
+    def test_run_report_can_be_cancelled(self):
+        df = pd.DataFrame({'FTTO': ['éligible', 'Non éligible'], 'FTTH': ['éligible', 'éligible']})
+        config = {'data_colors': ['#76C5BC', '#48B77D'], 'chart_cache': False}
+        cancel = threading.Event()
+        progress = []
+        def on_progress(done, total, label):
+            progress.append((done, total, label))
+            cancel.set()
+        with tempfile.TemporaryDirectory() as output_folder:
+            result = run_report(df, [('FTTO', 'Pie Chart', '%'), ('FTTH', 'Pie Chart', '%')], config, output_folder,
+                                chart_workers=1, progress=on_progress, cancel=cancel)
+        self.assertListEqual(progress, [(1, 2, 'FTTO')])
+        self.assertEqual(result["errors"][0]["stage"], "cancelled")
+
+    def test_target_output_folder(self):
+        self.assertEqual(target_output_folder("out", "/data/Export.xlsx", 0), os.path.join("out", "Export"))
+        self.assertEqual(target_output_folder("out", "/data/Export.xlsx", "Ile/de France"), os.path.join("out", "Export", "Ile_de France"))
+
+    def test_list_targets_rejects_unknown_sheets(self):
+        with tempfile.TemporaryDirectory() as folder:
+            workbook_path = os.path.join(folder, 'Export.xlsx')
+            with pd.ExcelWriter(workbook_path) as writer:
+                pd.DataFrame({'FTTO': ['éligible']}).to_excel(writer, sheet_name='Nord', index=False)
+                pd.DataFrame({'FTTO': ['éligible']}).to_excel(writer, sheet_name='Sud', index=False)
+            config = {'ingest_cache': False}
+            self.assertListEqual(list_targets([workbook_path], ['Sud'], config=config), [(workbook_path, 'Sud')])
+            with self.assertRaisesRegex(ValueError, 'Typo'):
+                list_targets([workbook_path], ['Sud', 'Typo'], config=config)
+
+    def test_target_label(self):
+        self.assertEqual(target_label("/data/Export.xlsx", 0), "Export")
+        self.assertEqual(target_label("/data/Export.xlsx", "Nord"), "Export / Nord")
+
+class TestStreaming(unittest.TestCase):
+    def test_streaming_enabled(self):
+        self.assertTrue(streaming_enabled(2000000, {'streaming_rows': 1000000}))
+        self.assertFalse(streaming_enabled(None, {'streaming_rows': 1000000}))
+        self.assertTrue(streaming_enabled(None, {}, {'streaming': True}))
+        self.assertFalse(streaming_enabled(2000000, {'streaming_rows': 1000000}, {'streaming': False}))
+
+    def test_streamed_job_matches_loaded_job(self):
+        df = pd.DataFrame({'FTTO': ['éligible', 'Non éligible', 'éligible', 'Sur devis', 'éligible'],
+                           'Debit': [10, 20, 15, 40, 25],
+                           'Latitude': [48.85, 48.86, 43.3, 45.76, 50.63], 'Longitude': [2.35, 2.36, 5.37, 4.83, 3.06]})
+        spec = {"columns": ["FTTO", {"column": "Debit", "chart_type": "Line Chart"}], "map": True}
+        with tempfile.TemporaryDirectory() as output_folder:
+            workbook_path = os.path.join(output_folder, 'Export.xlsx')
+            df.to_excel(workbook_path, index=False)
+            # Error cells are missing values whether the sheet is streamed or loaded.
+            workbook = openpyxl.load_workbook(workbook_path)
+            workbook.active['B3'] = '#DIV/0!'
+            workbook.active['A5'] = '#REF!'
+            workbook.save(workbook_path)
+            config = {'data_colors': ['#76C5BC', '#48B77D'], 'chart_cache': False, 'ingest_cache': False, 'streaming_chunk_rows': 2}
+            with patch('ingest.WorkbookReader.read_sheet', side_effect=AssertionError("sheet loaded")):
+                streamed = run_job(workbook_path, 0, parse_job(dict(spec, streaming=True)), config, os.path.join(output_folder, 'streamed'))
+            loaded = run_job(workbook_path, 0, parse_job(spec), config, os.path.join(output_folder, 'loaded'))
+            self.assertTrue(streamed["ok"], streamed)
+            self.assertTrue(os.path.exists(streamed["map"]))
+            for streamed_chart, loaded_chart in zip(streamed["charts"], loaded["charts"]):
+                with open(streamed_chart["path"], 'rb') as streamed_file, open(loaded_chart["path"], 'rb') as loaded_file:
+                    self.assertEqual(streamed_file.read(), loaded_file.read(), streamed_chart["column"])
+
+class TestRunAnalysis(unittest.TestCase):
+    def write_workbook(self, folder):
+        # Only Nord has an FTTH column, Sud names its coordinates differently.
+        workbook_path = os.path.join(folder, 'Export.xlsx')
+        with pd.ExcelWriter(workbook_path) as writer:
+            pd.DataFrame({'FTTO': ['éligible', 'Non éligible'], 'FTTH': ['éligible', 'éligible'],
+                          'Latitude': [48.85, 48.86], 'Longitude': [2.35, 2.36]}).to_excel(writer, sheet_name='Nord', index=False)
+            pd.DataFrame({'FTTO': ['éligible'], 'GPS Y': [43.3], 'GPS X': [5.37]}).to_excel(writer, sheet_name='Sud', index=False)
+        return workbook_path
+
+    def test_combined_outputs_cover_every_sheet(self):
+        job = parse_job({"columns": ["FTTO"], "map": True, "map_columns": ["FTTO", "FTTH"]})
+        with tempfile.TemporaryDirectory() as output_folder:
+            config = {'data_colors': ['#76C5BC', '#48B77D'], 'chart_cache': False, 'save_png': False,
+                      'cache_folder': os.path.join(output_folder, 'cache'), 'color_title': '#000000', 'color_text': '#000000',
+                      'logo_path': os.path.join('images', 'logo.png')}
+            workbook_path = self.write_workbook(output_folder)
+            with patch('engine.run_map', wraps=run_map) as mock_map:
+                analysis = run_analysis([(workbook_path, 'Nord'), (workbook_path, 'Sud')], job, config,
+                                        os.path.join(output_folder, 'out'), combine=True, max_workers=1)
+                combined_df = mock_map.call_args_list[-1].args[0]
+            self.assertTrue(analysis["ok"], analysis)
+            self.assertTrue(os.path.exists(os.path.join(output_folder, 'out', 'Export', 'Nord', 'FTTO.png')))
+            self.assertTrue(os.path.exists(analysis["combined"]["pdf"]))
+            self.assertTrue(os.path.exists(analysis["combined"]["map"]))
+        self.assertListEqual([round(value, 4) for value in combined_df['Latitude']], [48.85, 48.86, 43.3])
+        self.assertListEqual(list(combined_df[SOURCE_COLUMN]), ['Export / Nord', 'Export / Nord', 'Export / Sud'])
+        self.assertListEqual(list(combined_df['FTTH']), ['éligible', 'éligible', ''])
+
+    def test_combined_map_of_streamed_sheets_is_streamed(self):
+        job = parse_job({"columns": ["FTTO"], "map": True, "map_columns": ["FTTO", "FTTH"], "streaming": True})
+        with tempfile.TemporaryDirectory() as output_folder:
+            config = {'data_colors': ['#76C5BC', '#48B77D'], 'chart_cache': False, 'ingest_cache': False, 'streaming_chunk_rows': 1,
+                      'color_title': '#000000', 'color_text': '#000000', 'logo_path': os.path.join('images', 'logo.png')}
+            workbook_path = self.write_workbook(output_folder)
+            with patch('ingest.WorkbookReader.read_sheet', side_effect=AssertionError("sheet loaded")), \
+                    patch('engine.StreamingMap.add', autospec=True, side_effect=StreamingMap.add) as mock_add:
+                analysis = run_analysis([(workbook_path, 'Nord'), (workbook_path, 'Sud')], job, config,
+                                        os.path.join(output_folder, 'out'), combine=True, max_workers=1)
+            self.assertTrue(analysis["ok"], analysis)
+            self.assertTrue(os.path.exists(analysis["combined"]["map"]))
+        chunks = [call.args[1] for call in mock_add.call_args_list if SOURCE_COLUMN in call.args[1].columns]
+        self.assertListEqual([chunk['Latitude'].iloc[0] for chunk in chunks], [48.85, 48.86, 43.3])
+        self.assertListEqual([chunk['FTTH'].iloc[0] for chunk in chunks], ['éligible', 'éligible', ''])
+
+if __name__ == '__main__':
+    unittest.main()
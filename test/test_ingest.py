@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import openpyxl
+import pandas as pd
+from ingest import compact_frame, open_workbook
+
+class TestWorkbookReader(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.workbook_path = os.path.join(self.tmp.name, 'export.xlsx')
+        self.config = {'cache_folder': os.path.join(self.tmp.name, 'cache')}
+        with pd.ExcelWriter(self.workbook_path) as writer:
+            pd.DataFrame({'FTTO': ['éligible', 'Non éligible'], 'Code': [75001, 'A12']}).to_excel(writer, sheet_name='Nord', index=False)
+            pd.DataFrame({'FTTH': ['éligible']}).to_excel(writer, sheet_name='Sud', index=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_second_open_is_served_from_cache(self):
+        with open_workbook(self.workbook_path, self.config) as reader:
+            self.assertListEqual(reader.sheet_names, ['Nord', 'Sud'])
+            first = reader.read_sheet('Sud')
+            mixed = reader.read_sheet('Nord')
+        with patch('ingest.pd.ExcelFile', side_effect=AssertionError("workbook re-parsed")):
+            with open_workbook(self.workbook_path, self.config) as reader:
+                self.assertListEqual(reader.sheet_names, ['Nord', 'Sud'])
+                pd.testing.assert_frame_equal(reader.read_sheet('Sud'), first)
+                pd.testing.assert_frame_equal(reader.read_sheet(0), mixed)
+
+    def test_chunks_match_read_excel(self):
+        df = pd.DataFrame({'FTTO': ['éligible', None, None, 'éligible', None, None],
+                           'Debit': [1, None, None, 4, 5, None], 'Code': ['A', 'B', None, None, None, 'C']})
+        df.to_excel(self.workbook_path, sheet_name='Export', index=False)
+        for columns in (['Debit', 'FTTO'], ['Debit']):
+            with open_workbook(self.workbook_path, self.config) as reader:
+                chunks = list(reader.iter_chunks('Export', columns, chunk_rows=2))
+            self.assertListEqual([len(chunk) for chunk in chunks], [2, 2, 2])
+            self.assertListEqual(list(chunks[1].index), [2, 3])
+            # Each chunk infers its own dtypes, an all-empty one is float, compare values only.
+            pd.testing.assert_frame_equal(pd.concat(chunks), pd.read_excel(self.workbook_path, sheet_name='Export', usecols=columns),
+                                          check_dtype=False)
+
+    def test_modified_workbook_invalidates_cache(self):
+        with open_workbook(self.workbook_path, self.config) as reader:
+            reader.read_sheet('Sud')
+        pd.DataFrame({'FTTH': ['Non éligible', 'éligible']}).to_excel(self.workbook_path, sheet_name='Sud', index=False)
+        os.utime(self.workbook_path, ns=(0, 10 ** 18))
+        with open_workbook(self.workbook_path, self.config) as reader:
+            self.assertListEqual(reader.sheet_names, ['Sud'])
+            self.assertEqual(len(reader.read_sheet('Sud')), 2)
+        self.assertEqual(len(os.listdir(self.config['cache_folder'])), 1)
+
+    def test_least_recently_used_workbooks_are_pruned(self):
+        cache_folder = self.config['cache_folder']
+        paths = [os.path.join(self.tmp.name, f'{name}.xlsx') for name in ('a', 'b', 'c')]
+        for age, path in enumerate(paths[:2]):
+            shutil.copy(self.workbook_path, path)
+            with open_workbook(path, self.config) as reader:
+                reader.read_sheet('Nord')
+                os.utime(os.path.join(reader.cache_dir, 'meta.json'), ns=(10 ** 18 + age, 10 ** 18 + age))
+                entry_size = sum(os.path.getsize(os.path.join(reader.cache_dir, name)) for name in os.listdir(reader.cache_dir))
+        # Reading a.xlsx from the cache makes b.xlsx the least recently used workbook.
+        with open_workbook(paths[0], self.config) as reader:
+            reader.read_sheet('Nord')
+        shutil.copy(self.workbook_path, paths[2])
+        config = dict(self.config, ingest_cache_max_mb=2.5 * entry_size / 1024 / 1024)
+        with open_workbook(paths[2], config) as reader:
+            reader.read_sheet('Nord')
+        cached = set()
+        for entry in os.listdir(cache_folder):
+            with open(os.path.join(cache_folder, entry, 'meta.json'), 'r', encoding='utf-8') as meta_file:
+                cached.add(json.load(meta_file)['file_path'])
+        self.assertSetEqual(cached, {os.path.abspath(paths[0]), os.path.abspath(paths[2])})
+
+    def test_inspect_sheet_reads_header_only(self):
+        with open_workbook(self.workbook_path, self.config) as reader:
+            self.assertDictEqual(reader.inspect_sheet('Nord'), {'columns': ['FTTO', 'Code'], 'rows': 2})
+
+    def test_read_sheet_prunes_columns_and_extends_cache(self):
+        with open_workbook(self.workbook_path, self.config) as reader:
+            self.assertListEqual(reader.read_sheet('Nord', ['Code']).columns.tolist(), ['Code'])
+            self.assertListEqual(reader.read_sheet('Nord', ['FTTO']).columns.tolist(), ['FTTO'])
+        with patch('ingest.pd.ExcelFile', side_effect=AssertionError("workbook re-parsed")):
+            with open_workbook(self.workbook_path, self.config) as reader:
+                df = reader.read_sheet('Nord', ['Code', 'FTTO'])
+        self.assertListEqual(df.columns.tolist(), ['FTTO', 'Code'])
+        self.assertListEqual(df['Code'].tolist(), [75001, 'A12'])
+
+    def test_pruned_read_matches_read_excel(self):
+        df = pd.DataFrame({'Debit': [1, None, 3, 4, None], 'FTTO': ['éligible', None, None, 'Non éligible', 'éligible'],
+                           'Code': [None, None, 'A12', None, None]})
+        df.to_excel(self.workbook_path, sheet_name='Export', index=False)
+        for columns in (['Debit'], ['Code'], ['Debit', 'FTTO'], ['FTTO', 'Code']):
+            with open_workbook(self.workbook_path, {'ingest_cache': False}) as reader:
+                pd.testing.assert_frame_equal(reader.read_sheet('Export', columns),
+                                              pd.read_excel(self.workbook_path, sheet_name='Export', usecols=columns))
+
+    def test_error_cells_match_read_excel(self):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = 'Export'
+        for row in (['Debit', 'Ratio', 'Code'], [1, '#DIV/0!', 'A12'], ['#REF!', 0.5, None],
+                    [3, None, '#VALUE!'], [None, '#N/A', None]):
+            sheet.append(row)
+        workbook.save(self.workbook_path)
+        for columns in (['Debit'], ['Ratio'], ['Debit', 'Code'], ['Ratio', 'Code']):
+            with open_workbook(self.workbook_path, {'ingest_cache': False}) as reader:
+                pd.testing.assert_frame_equal(reader.read_sheet('Export', columns),
+                                              pd.read_excel(self.workbook_path, sheet_name='Export', usecols=columns))
+
+    def test_cache_disabled(self):
+        with open_workbook(self.workbook_path, {'ingest_cache': False}) as reader:
+            self.assertIsNone(reader.cache_dir)
+            self.assertEqual(len(reader.read_sheet('Nord')), 2)
+
+class TestCompactFrame(unittest.TestCase):
+    def test_compact_frame(self):
+        df = pd.DataFrame({
+            'FTTO': ['éligible', 'Non éligible', 'Non éligible', None] * 25,
+            'Ref': [f'R{i}' for i in range(100)],
+            'Sites': range(100),
+            'Debit': [0.1 * i for i in range(100)],
+            'Ratio': [0.5, 1.5, None, 2.0] * 25,
+            'Latitude': [48.856613] * 100,
+        })
+        compacted = compact_frame(df, ('Latitude', 'Longitude'))
+        self.assertEqual(compacted['FTTO'].dtype, 'category')
+        self.assertListEqual(list(compacted['FTTO'].cat.categories), ['éligible', 'Non éligible'])
+        self.assertListEqual(compacted['FTTO'].value_counts().index.tolist(), df['FTTO'].value_counts().index.tolist())
+        self.assertEqual(compacted['Ref'].dtype, df['Ref'].dtype)
+        self.assertEqual(compacted['Sites'].dtype, 'int8')
+        self.assertEqual(compacted['Debit'].dtype, 'float64')
+        self.assertEqual(compacted['Ratio'].dtype, 'float32')
+        self.assertEqual(compacted['Latitude'].dtype, 'float32')
+        self.assertAlmostEqual(float(compacted['Latitude'].iloc[0]), 48.856613, places=5)
+        self.assertLess(compacted.memory_usage(deep=True).sum(), df.memory_usage(deep=True).sum())
+        self.assertEqual(df['FTTO'].dtype, pd.Series(['x']).dtype)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import unittest
+from instrument import SPANS_ENV, configure, profiled, span
+
+class TestSpans(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.spans_file = os.path.join(self.tmp.name, 'spans.jsonl')
+
+    def tearDown(self):
+        configure(None)
+        self.tmp.cleanup()
+
+    def read_spans(self):
+        with open(self.spans_file, 'r', encoding='utf-8') as spans_file:
+            return [json.loads(line) for line in spans_file]
+
+    def test_spans_are_written_as_json_lines(self):
+        configure(self.spans_file)
+        self.assertEqual(os.environ[SPANS_ENV], self.spans_file)
+        with span("job", workbook="w.xlsx"):
+            with span("chart_render", column="FTTO"):
+                sum(range(1000))
+        inner, outer = self.read_spans()
+        self.assertEqual((inner["span"], outer["span"]), ("chart_render", "job"))
+        self.assertEqual(inner["parent"], outer["id"])
+        self.assertEqual(inner["column"], "FTTO")
+        for key in ("wall_ms", "cpu_ms", "rss_mb", "rss_delta_mb"):
+            self.assertIn(key, inner)
+
+    def test_failed_spans_record_the_error(self):
+        configure(self.spans_file)
+        with self.assertRaises(ValueError):
+            with span("sheet_parse"):
+                raise ValueError("bad sheet")
+        self.assertEqual(self.read_spans()[0]["error"], "ValueError")
+
+    def test_disabled_spans_write_nothing(self):
+        configure(None)
+        with span("job"):
+            pass
+        self.assertFalse(os.path.exists(self.spans_file))
+        self.assertNotIn(SPANS_ENV, os.environ)
+
+    def test_profiled_dumps_stats(self):
+        profile_path = os.path.join(self.tmp.name, 'run.prof')
+        with profiled(profile_path):
+            sorted(range(1000), reverse=True)
+        self.assertTrue(os.path.getsize(profile_path) > 0)
+        self.assertTrue(os.path.exists(f'{profile_path}.txt'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,18 +1,25 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
 import pandas as pd
-from interactive_map import generate_interactive_map
+from aggregates import ColumnAggregates
+from interactive_map import StreamingMap, generate_interactive_map, marker_colors, popup_html
 
 class TestGenerateInteractiveMap(unittest.TestCase):
-    @patch('interactive_map.messagebox.showerror')
-    def test_generate_interactive_map_invalid_columns(self, mock_showerror):
+    def test_generate_interactive_map_invalid_columns(self):
         df = pd.DataFrame({
             'lat': [1, 2],
             'lon': [3, 4],
             'other': [5, 6]
         })
-        generate_interactive_map(df, 'invalid_lat', 'invalid_lon', ['other'], 'output_folder')
-        mock_showerror.assert_called_with("Error", "Invalid latitude or longitude column selection.")
+        with self.assertRaisesRegex(ValueError, "Invalid latitude or longitude column selection."):
+            generate_interactive_map(df, 'invalid_lat', 'invalid_lon', ['other'], 'output_folder')
+
+    def test_generate_interactive_map_rejects_projected_coordinates(self):
+        df = pd.DataFrame({'Latitude': [6862000.0, 6863000.0], 'Longitude': [652000.0, 653000.0]})
+        with self.assertRaisesRegex(ValueError, "not valid WGS84 coordinates"):
+            generate_interactive_map(df, 'Latitude', 'Longitude', [], 'output_folder')
 
     @patch('interactive_map.folium.Map.save')
     @patch('interactive_map.folium.plugins.MarkerCluster.add_to')
@@ -31,5 +38,96 @@ class TestGenerateInteractiveMap(unittest.TestCase):
         mock_marker_cluster_add_to.assert_called()
         mock_map_instance.save.assert_called()
 
+    def test_generate_interactive_map_large_dataset_mode(self):
+        df = pd.DataFrame({
+            'lat': [48.85, 45.76, 43.30],
+            'lon': [2.35, 4.83, 5.37],
+            'FTTO': ['éligible', 'Non éligible', 'Sur Devis']
+        })
+        with tempfile.TemporaryDirectory() as output_folder:
+            map_file_path = generate_interactive_map(df, 'lat', 'lon', ['FTTO'], output_folder, large_threshold=2)
+            data_file_path = map_file_path.replace('.html', '_data.js')
+            with open(map_file_path, encoding='utf-8') as map_file:
+                html = map_file.read()
+            with open(data_file_path, encoding='utf-8') as data_file:
+                data = data_file.read()
+        self.assertIn(f'<script src="{os.path.basename(data_file_path)}"></script>', html)
+        self.assertNotIn('Sur Devis', html)
+        self.assertIn('"colors":["green","orange"]', data)
+        self.assertIn('[43.3,5.37,0,"FTTO: Sur Devis"]', data)
+
+    def test_generate_interactive_map_spatial_pyramid_mode(self):
+        df = pd.DataFrame({
+            'lat': [48.85, 48.86, 43.30],
+            'lon': [2.35, 2.36, 5.37],
+            'FTTH': ['éligible', 'Non éligible', 'Sur Devis']
+        })
+        with tempfile.TemporaryDirectory() as output_folder:
+            map_file_path = generate_interactive_map(df, 'lat', 'lon', ['FTTH'], output_folder, pyramid_threshold=2, raw_zoom=10)
+            base_name = os.path.basename(map_file_path)[:-len('.html')]
+            with open(map_file_path, encoding='utf-8') as map_file:
+                html = map_file.read()
+            with open(os.path.join(output_folder, f'{base_name}_pyramid.js'), encoding='utf-8') as data_file:
+                data = data_file.read()
+            tiles = sorted(os.listdir(os.path.join(output_folder, f'{base_name}_tiles')))
+        self.assertIn(f'<script src="{base_name}_pyramid.js"></script>', html)
+        self.assertIn('"0":[[47.003333,3.36,3,[2,1]]]', data)
+        self.assertIn('"raw_zoom":10', data)
+        self.assertEqual(len([tile for tile in tiles if tile.endswith('_points.js')]), 2)
+        self.assertEqual(len([tile for tile in tiles if tile.endswith('_agg.js')]), 2)
+
+    def test_streaming_map_matches_spatial_pyramid(self):
+        df = pd.DataFrame({
+            'lat': [48.85, 48.86, 43.30],
+            'lon': [2.35, 2.36, 5.37],
+            'FTTH': ['éligible', 'Non éligible', 'Sur Devis']
+        })
+        with tempfile.TemporaryDirectory() as output_folder:
+            streaming_map = StreamingMap('lat', 'lon', ['FTTH'], output_folder, raw_zoom=10)
+            streaming_map.add(df.iloc[:1])
+            streaming_map.add(df.iloc[1:])
+            map_file_path = streaming_map.close()
+            base_name = os.path.basename(map_file_path)[:-len('.html')]
+            with open(os.path.join(output_folder, f'{base_name}_pyramid.js'), encoding='utf-8') as data_file:
+                data = data_file.read()
+            tiles_folder = os.path.join(output_folder, f'{base_name}_tiles')
+            points = {tile: open(os.path.join(tiles_folder, tile), encoding='utf-8').read().count('linkgraph_add_chunk(')
+                      for tile in os.listdir(tiles_folder) if tile.endswith('_points.js')}
+        self.assertIn('"colors":["blue","green","orange","red"]', data)
+        self.assertIn('"0":[[47.003333,3.36,3,[2,1,0,0]]]', data)
+        # The Paris tile got one call per chunk of rows.
+        self.assertListEqual(sorted(points.values()), [1, 2])
+
+    def test_streaming_map_rejects_projected_coordinates(self):
+        df = pd.DataFrame({'Latitude': [6862000.0], 'Longitude': [652000.0]})
+        with tempfile.TemporaryDirectory() as output_folder:
+            streaming_map = StreamingMap('Latitude', 'Longitude', [], output_folder)
+            with self.assertRaisesRegex(ValueError, "not valid WGS84 coordinates"):
+                streaming_map.add(df)
+            with self.assertRaisesRegex(ValueError, "No valid coordinates"):
+                streaming_map.close()
+
+class TestMarkerAttributes(unittest.TestCase):
+    def test_marker_colors(self):
+        df = pd.DataFrame({
+            'FTTO': ['éligible', 'Non éligible', 'Sur Devis - 1G', 'Sur Devis - 1G'],
+            'FTTH': ['Non éligible', 'Sur Devis', 'Sur Devis', 'Sur Devis'],
+            'Zone': ['A', 'A', 'Non éligible', 'B']
+        })
+        self.assertListEqual(marker_colors(df, ['FTTO', 'FTTH', 'Zone']).tolist(), ['blue', 'orange', 'red', 'green'])
+        aggregates = ColumnAggregates(df)
+        self.assertListEqual(marker_colors(df.iloc[1:], ['FTTO', 'FTTH', 'Zone'], aggregates).tolist(), ['orange', 'red', 'green'])
+
+    def test_popup_html(self):
+        df = pd.DataFrame({'FTTO': ['éligible', 'Non éligible'], 'Debit': [100, 200]})
+        self.assertListEqual(popup_html(df, ['FTTO', 'Debit']), ['FTTO: éligible<br>Debit: 100', 'FTTO: Non éligible<br>Debit: 200'])
+        self.assertListEqual(popup_html(df, []), [None, None])
+
+    def test_popup_html_missing_and_categorical_values(self):
+        df = pd.DataFrame({'FTTO': ['éligible', None, 'éligible'], 'Debit': [100.5, None, 3]})
+        expected = ['FTTO: éligible<br>Debit: 100.5', 'FTTO: nan<br>Debit: nan', 'FTTO: éligible<br>Debit: 3.0']
+        self.assertListEqual(popup_html(df, ['FTTO', 'Debit']), expected)
+        self.assertListEqual(popup_html(df.astype({'FTTO': 'category'}), ['FTTO', 'Debit']), expected)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,59 @@
+import threading
+import unittest
+from jobs import JobRunner
+
+class FakeRoot:
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, callback):
+        self.scheduled.append(callback)
+
+class TestJobRunner(unittest.TestCase):
+    def setUp(self):
+        self.root = FakeRoot()
+        self.runner = JobRunner(self.root)
+
+    def drain(self):
+        while self.root.scheduled:
+            self.root.scheduled.pop(0)()
+
+    def test_progress_and_result_are_delivered_on_poll(self):
+        progress, results = [], []
+        def job(count, progress=None, cancel=None):
+            for done in range(1, count + 1):
+                progress(done, count, f"chart {done}")
+            return {"errors": [], "count": count}
+        self.assertTrue(self.runner.submit("report", job, 3, on_progress=lambda *args: progress.append(args), on_done=results.append))
+        self.drain()
+        self.assertListEqual(progress, [(1, 3, "chart 1"), (2, 3, "chart 2"), (3, 3, "chart 3")])
+        self.assertListEqual(results, [{"errors": [], "count": 3}])
+        self.assertFalse(self.runner.busy)
+
+    def test_double_submission_is_rejected(self):
+        release = threading.Event()
+        results = []
+        def job(progress=None, cancel=None):
+            release.wait(5)
+            return {"errors": []}
+        self.assertTrue(self.runner.submit("report", job, on_done=results.append))
+        self.assertFalse(self.runner.submit("map", job, on_done=results.append))
+        release.set()
+        self.drain()
+        self.assertEqual(len(results), 1)
+
+    def test_cancel_and_failures(self):
+        results = []
+        started = threading.Event()
+        def job(progress=None, cancel=None):
+            started.set()
+            cancel.wait(5)
+            raise RuntimeError("stopped" if cancel.is_set() else "timeout")
+        self.runner.submit("report", job, on_done=results.append)
+        started.wait(5)
+        self.runner.cancel()
+        self.drain()
+        self.assertEqual(results, [{"errors": [{"stage": "job", "message": "stopped"}]}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,15 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
+import numpy as np
 import pandas as pd
-from reports import load_data
+import reports
+from aggregates import ColumnAggregates
+from reports import (HAS_SVGLIB, load_data, generate_charts, prepare_chart, create_pdf_report, render_chart, default_chart_type,
+                     eligible_chart_types, resolve_chart_format)
+
+CONFIG = {'data_colors': ['#76C5BC', '#48B77D', '#4BBABB']}
 
 class TestLoadData(unittest.TestCase):
     @patch('pandas.read_excel')
@@ -22,5 +30,134 @@ class TestLoadData(unittest.TestCase):
         self.assertIsNone(df)
         self.assertListEqual(columns, [])
 
+class TestGenerateCharts(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            'FTTO': ['éligible', 'Non éligible', 'éligible'],
+            'FTTH - Statut': ['éligible', 'éligible', 'Non éligible'],
+            'Debit': [10, 20, 30],
+            'Sites': [1, 2, 3]
+        })
+        self.pairs = [('FTTO', 'Pie Chart', '%'), ('FTTH - Statut', 'Bar Chart', 'Nombre'),
+                      ('Debit', 'Line Chart', 'Nombre'), ('Sites', 'Scatter Plot', 'Nombre')]
+
+    def test_prepare_chart_ships_aggregates_only(self):
+        job = prepare_chart(self.df, 'FTTO', 'Pie Chart', '%', self.pairs, CONFIG)
+        self.assertListEqual(job['labels'], ['éligible', 'Non éligible'])
+        self.assertListEqual(job['values'].tolist(), [2, 1])
+        self.assertNotIn('x', job)
+
+    def test_prepare_chart_reduces_large_series(self):
+        df = pd.DataFrame({'Debit': np.arange(100000.0), 'Sites': np.arange(100000.0) % 7})
+        pairs = [('Debit', 'Line Chart', 'Nombre'), ('Sites', 'Scatter Plot', 'Nombre')]
+        line = prepare_chart(df, 'Debit', 'Line Chart', 'Nombre', pairs, CONFIG)
+        self.assertLess(len(line['y']), 5000)
+        scatter = prepare_chart(df, 'Sites', 'Scatter Plot', 'Nombre', pairs, dict(CONFIG, scatter_density_threshold=1000))
+        self.assertNotIn('x', scatter)
+        self.assertEqual(scatter['density'].sum(), 100000)
+        self.assertTrue(render_chart(scatter).startswith(b'\x89PNG'))
+
+    def test_chart_eligibility_follows_the_data(self):
+        aggregates = ColumnAggregates(self.df)
+        self.assertListEqual(eligible_chart_types(aggregates.profile('FTTO')), ['Pie Chart', 'Bar Chart'])
+        self.assertIn('Line Chart', eligible_chart_types(aggregates.profile('Debit')))
+        self.assertEqual(default_chart_type(aggregates.profile('Debit')), 'Pie Chart')
+        self.assertEqual(default_chart_type(ColumnAggregates(pd.DataFrame({'Debit': range(100)})).profile('Debit')), 'Line Chart')
+        with tempfile.TemporaryDirectory() as output_folder:
+            charts = list(generate_charts(self.df, [('FTTO', 'Line Chart', 'Nombre'), ('Debit', 'Line Chart', 'Nombre')], CONFIG, output_folder, workers=1))
+        self.assertListEqual([column for column, _, _ in charts], ['Debit'])
+
+    def test_generate_charts_parallel_keeps_selection_order(self):
+        with tempfile.TemporaryDirectory() as output_folder:
+            charts = list(generate_charts(self.df, self.pairs + [('Missing', 'Pie Chart', '%')], CONFIG, output_folder, workers=2))
+            self.assertListEqual([column for column, _, _ in charts], ['FTTO', 'FTTH - Statut', 'Debit', 'Sites'])
+            self.assertEqual(charts[1][1], os.path.join(output_folder, 'FTTH_Statut.png'))
+            for _, img_file_path, _ in charts:
+                self.assertTrue(os.path.getsize(img_file_path) > 0)
+
+    def test_chart_pool_is_reused_between_calls(self):
+        with tempfile.TemporaryDirectory() as output_folder, \
+                patch.dict(reports._pool, executor=None, workers=None), \
+                patch('reports.ProcessPoolExecutor', wraps=reports.ProcessPoolExecutor) as mock_pool:
+            list(generate_charts(self.df, self.pairs[:2], CONFIG, output_folder, workers=2))
+            self.assertEqual(mock_pool.call_count, 0)
+            for _ in range(2):
+                list(generate_charts(self.df, self.pairs, CONFIG, output_folder, workers=2))
+                os.remove(os.path.join(output_folder, 'manifest.json'))
+            self.assertEqual(mock_pool.call_count, 1)
+            reports._pool["executor"].shutdown()
+
+    def test_pdf_from_in_memory_charts(self):
+        config = dict(CONFIG, color_title='#000000', color_text='#000000', logo_path=os.path.join('images', 'logo.png'))
+        with tempfile.TemporaryDirectory() as output_folder:
+            charts = generate_charts(self.df, self.pairs, config, output_folder, workers=1, save_png=False)
+            pdf_file_path = create_pdf_report(config, charts, output_folder)
+            self.assertListEqual(sorted(os.listdir(output_folder)), sorted([os.path.basename(pdf_file_path), 'manifest.json']))
+            with open(pdf_file_path, 'rb') as pdf_file:
+                content = pdf_file.read()
+        self.assertEqual(content.count(b'/Type /Page\n'), 4)
+        self.assertEqual(content.count(b'/Subtype /Form'), 1)
+
+    def test_templates_do_not_leak_between_charts(self):
+        jobs = [prepare_chart(self.df, column, chart_type, display_type, self.pairs, CONFIG) for column, chart_type, display_type in self.pairs]
+        other = prepare_chart(self.df.iloc[:2], 'FTTO', 'Pie Chart', 'Nombre', self.pairs, CONFIG)
+        for chart_format, magic in [('png', b'\x89PNG'), ('svg', b'<?xml'), ('pdf', b'%PDF')]:
+            first = [render_chart(dict(job, format=chart_format)) for job in jobs]
+            render_chart(dict(other, format=chart_format))
+            again = [render_chart(dict(job, format=chart_format)) for job in reversed(jobs)][::-1]
+            self.assertListEqual(first, again)
+            self.assertTrue(first[0].startswith(magic))
+
+    def test_charts_fit_in_the_figure(self):
+        statuses = ['éligible sur étude longue durée (raccordement complexe)', 'Non éligible - zone blanche', 'Non renseigné']
+        df = pd.DataFrame({'FTTH - Statut de raccordement': statuses * 3 + statuses[:1], 'Débit moyen mesuré': range(10),
+                           'Sites': range(10)})
+        pairs = [('FTTH - Statut de raccordement', 'Pie Chart', '%'), ('FTTH - Statut de raccordement', 'Bar Chart', '%'),
+                 ('Débit moyen mesuré', 'Line Chart', 'Nombre'), ('Sites', 'Scatter Plot', 'Nombre')]
+        config = dict(CONFIG, scatter_density_threshold=5)
+        for column, chart_type, display_type in pairs:
+            job = prepare_chart(df, column, chart_type, display_type, pairs, config)
+            render_chart(job)
+            fig, ax, cax = reports._templates.figures['Density' if 'density' in job else chart_type]
+            renderer = fig.canvas.get_renderer()
+            for axes in filter(None, (ax, cax)):
+                bbox = axes.get_tightbbox(renderer)
+                self.assertGreaterEqual(bbox.x0, 0, chart_type)
+                self.assertGreaterEqual(bbox.y0, 0, chart_type)
+                self.assertLessEqual(bbox.x1, fig.bbox.x1, chart_type)
+                self.assertLessEqual(bbox.y1, fig.bbox.y1, chart_type)
+            # The percentages stay inside the axes, above their bar.
+            for text in ax.texts:
+                self.assertLessEqual(text.get_window_extent(renderer).y1, ax.bbox.y1, chart_type)
+
+    def test_resolve_chart_format(self):
+        self.assertEqual(resolve_chart_format({}), 'png')
+        self.assertEqual(resolve_chart_format({'chart_format': 'tiff'}), 'png')
+        self.assertEqual(resolve_chart_format({'chart_format': 'pdf'}), 'pdf')
+        # reportlab cannot embed PDF charts.
+        self.assertEqual(resolve_chart_format({'chart_format': 'pdf'}, pdf=True), 'png')
+        with patch('reports.HAS_SVGLIB', False):
+            self.assertEqual(resolve_chart_format({'chart_format': 'svg'}), 'svg')
+            self.assertEqual(resolve_chart_format({'chart_format': 'svg'}, pdf=True), 'png')
+
+    def test_vector_chart_files(self):
+        with tempfile.TemporaryDirectory() as output_folder:
+            charts = list(generate_charts(self.df, self.pairs, CONFIG, output_folder, workers=1, chart_format='svg'))
+            self.assertEqual(charts[0][1], os.path.join(output_folder, 'FTTO.svg'))
+            with open(charts[0][1], 'rb') as img_file:
+                self.assertEqual(img_file.read(), charts[0][2])
+
+    @unittest.skipUnless(HAS_SVGLIB, "svglib is not installed")
+    def test_pdf_embeds_svg_charts(self):
+        config = dict(CONFIG, color_title='#000000', color_text='#000000', logo_path=os.path.join('images', 'logo.png'))
+        with tempfile.TemporaryDirectory() as output_folder:
+            charts = generate_charts(self.df, self.pairs, config, output_folder, workers=1, save_png=False, chart_format='svg')
+            pdf_file_path = create_pdf_report(config, charts, output_folder)
+            with open(pdf_file_path, 'rb') as pdf_file:
+                content = pdf_file.read()
+        self.assertEqual(content.count(b'/Type /Page\n'), 4)
+        # Only the logo is an image, the charts are drawn as vectors.
+        self.assertEqual(content.count(b'/Subtype /Image'), 1)
+
 if __name__ == '__main__':
     unittest.main()
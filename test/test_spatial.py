@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+from spatial import CELLS_PER_TILE, build_cluster_pyramid, grid_cells, group_by_chunk, level_entries, split_by_chunk
+
+class TestGridCells(unittest.TestCase):
+    def test_grid_cells_web_mercator(self):
+        cx, cy = grid_cells([0.0, 85.0511, -89.0], [0.0, -180.0, 179.999], 0)
+        self.assertListEqual(cx.tolist(), [2, 0, CELLS_PER_TILE - 1])
+        self.assertListEqual(cy.tolist(), [2, 0, CELLS_PER_TILE - 1])
+
+class TestClusterPyramid(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.lats = rng.uniform(43, 50, 500)
+        self.lons = rng.uniform(-1, 7, 500)
+        self.color_codes = rng.integers(0, 3, 500)
+
+    def test_every_level_keeps_all_points(self):
+        levels, color_columns = build_cluster_pyramid(self.lats, self.lons, self.color_codes, 3, max_zoom=10)
+        self.assertListEqual(sorted(levels), list(range(11)))
+        for level in levels.values():
+            entries = level_entries(level, color_columns)
+            self.assertEqual(sum(entry[2] for entry in entries), 500)
+            self.assertEqual(sum(entry[3][2] for entry in entries), int((self.color_codes == 2).sum()))
+        self.assertLessEqual(len(levels[0]), len(levels[10]))
+
+    def test_parent_cells_match_direct_indexing(self):
+        levels, _ = build_cluster_pyramid(self.lats, self.lons, self.color_codes, 3, max_zoom=9)
+        cx, cy = grid_cells(self.lats, self.lons, 5)
+        self.assertSetEqual(set(levels[5].index), set(zip(cx.tolist(), cy.tolist())))
+
+    def test_chunks_partition_cells_and_points(self):
+        levels, color_columns = build_cluster_pyramid(self.lats, self.lons, self.color_codes, 3, max_zoom=10)
+        chunks = split_by_chunk(levels[10], 10, color_columns)
+        self.assertEqual(sum(len(entries) for entries in chunks.values()), len(levels[10]))
+        point_chunks = dict(group_by_chunk(self.lats, self.lons))
+        self.assertEqual(sum(len(rows) for rows in point_chunks.values()), 500)
+        self.assertSetEqual(set(point_chunks), set(chunks))
+
+if __name__ == '__main__':
+    unittest.main()
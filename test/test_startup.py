@@ -0,0 +1,33 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Importing the GUI module must not pull in the analysis libraries, they are
+# loaded in the background once the window is shown.
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib', 'reportlab', 'folium', 'pyarrow']
+IMPORT_BUDGET_SECONDS = 1.0
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+print(json.dumps({"seconds": time.perf_counter() - start,
+                  "loaded": [name for name in %r if name in sys.modules]}))
+""" % HEAVY_MODULES
+
+class TestStartup(unittest.TestCase):
+    def test_main_import_stays_within_budget(self):
+        env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+        # main logs to app.log in the working directory.
+        with tempfile.TemporaryDirectory() as work_dir:
+            output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=work_dir, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        self.assertListEqual(result["loaded"], [])
+        self.assertLess(result["seconds"], IMPORT_BUDGET_SECONDS)
+
+if __name__ == '__main__':
+    unittest.main()
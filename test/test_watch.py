@@ -0,0 +1,133 @@
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from engine import parse_job
+from watch import FolderWatcher, job_profile, scan_folder
+
+def fake_run_job(workbook, sheet, job, config, output_folder, chart_workers=None):
+    return {"workbook": workbook, "sheet": sheet, "output_folder": output_folder, "charts": [], "pdf": None,
+            "map": None, "errors": [], "ok": True}
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.now = [0.0]
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+        self.folder.cleanup()
+
+    def write(self, name, content=b'data'):
+        path = os.path.join(self.folder.name, name)
+        with open(path, 'wb') as workbook_file:
+            workbook_file.write(content)
+        return path
+
+    def watcher(self, **kwargs):
+        return FolderWatcher(self.folder.name, parse_job({"columns": ["FTTO"]}), {}, 'out', settle_seconds=2,
+                             executor=self.executor, clock=lambda: self.now[0], **kwargs)
+
+    def poll_at(self, watcher, now):
+        self.now[0] = now
+        return watcher.poll()
+
+    def test_scan_folder_skips_lock_and_other_files(self):
+        path = self.write('Export.xlsx')
+        self.write('~$Export.xlsx')
+        self.write('notes.txt')
+        self.assertListEqual(list(scan_folder(self.folder.name)), [path])
+
+    def test_job_profile(self):
+        config = {'job_profiles': {'nord': {'columns': ['FTTO'], 'map': True, 'sheets': ['Nord']}}}
+        job, sheets, all_sheets = job_profile(config, 'nord')
+        self.assertTrue(job["map"])
+        self.assertListEqual(sheets, ['Nord'])
+        self.assertFalse(all_sheets)
+        with self.assertRaises(ValueError):
+            job_profile(config, 'sud')
+
+    @patch('watch.list_targets', side_effect=lambda workbooks, *args: [(workbooks[0], 0)])
+    @patch('watch.run_job', side_effect=fake_run_job)
+    def test_workbook_processed_once_settled(self, mock_run_job, mock_targets):
+        watcher = self.watcher()
+        watcher.start()
+        path = self.write('Export.xlsx')
+        self.poll_at(watcher, 0)
+        self.poll_at(watcher, 1.5)
+        # Still being written, the settle delay starts over.
+        self.write('Export.xlsx', b'more data')
+        self.poll_at(watcher, 2.5)
+        self.assertEqual(mock_run_job.call_count, 0)
+        self.poll_at(watcher, 4)
+        self.assertEqual(mock_run_job.call_count, 0)
+        self.poll_at(watcher, 4.5)
+        self.assertEqual(mock_run_job.call_count, 1)
+        self.assertEqual(mock_run_job.call_args.args[:2], (path, 0))
+        for future in list(watcher.running):
+            future.result()
+        results = self.poll_at(watcher, 5)
+        self.assertEqual([result["workbook"] for result in results], [path])
+        self.poll_at(watcher, 10)
+        self.assertEqual(mock_run_job.call_count, 1)
+
+    @patch('watch.list_targets', side_effect=lambda workbooks, *args: [(workbooks[0], 0)])
+    def test_existing_workbooks_skipped_unless_asked(self, mock_targets):
+        self.write('Export.xlsx')
+        with patch('watch.run_job', side_effect=fake_run_job) as mock_run_job:
+            watcher = self.watcher()
+            watcher.start()
+            self.poll_at(watcher, 0)
+            self.poll_at(watcher, 3)
+            self.assertEqual(mock_run_job.call_count, 0)
+            watcher = self.watcher()
+            watcher.start(process_existing=True)
+            self.poll_at(watcher, 0)
+            self.poll_at(watcher, 3)
+            self.assertEqual(mock_run_job.call_count, 1)
+
+    @patch('watch.list_targets', side_effect=lambda workbooks, *args: [(workbooks[0], 0)])
+    def test_queue_is_bounded(self, mock_targets):
+        release = threading.Event()
+        def blocking_run_job(*args, **kwargs):
+            release.wait(5)
+            return fake_run_job(*args, **kwargs)
+        with patch('watch.run_job', side_effect=blocking_run_job) as mock_run_job:
+            watcher = self.watcher(queue_size=1)
+            watcher.start()
+            self.write('Nord.xlsx')
+            self.write('Sud.xlsx')
+            self.poll_at(watcher, 0)
+            self.poll_at(watcher, 3)
+            self.assertEqual(len(watcher.running), 1)
+            self.assertEqual(len(watcher.pending), 1)
+            release.set()
+            for future in list(watcher.running):
+                future.result()
+            self.poll_at(watcher, 4)
+            for future in list(watcher.running):
+                future.result()
+            self.assertEqual(mock_run_job.call_count, 2)
+
+    @patch('watch.list_targets', side_effect=lambda workbooks, *args: [(workbooks[0], 0)])
+    def test_failed_submit_is_retried(self, mock_targets):
+        with patch('watch.run_job', side_effect=fake_run_job) as mock_run_job:
+            watcher = self.watcher()
+            watcher.start()
+            self.write('Export.xlsx')
+            self.poll_at(watcher, 0)
+            with patch.object(self.executor, 'submit', side_effect=RuntimeError("cannot schedule new futures after shutdown")):
+                self.poll_at(watcher, 3)
+            self.assertEqual(len(watcher.running), 0)
+            self.assertEqual(len(watcher.processed), 0)
+            self.poll_at(watcher, 4)
+            self.assertEqual(len(watcher.running), 1)
+            for future in list(watcher.running):
+                future.result()
+            self.assertEqual(mock_run_job.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
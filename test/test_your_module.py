@@ -1,6 +1,6 @@
 import unittest
 import pandas as pd
-from main import detect_gps_columns
+from column_profile import detect_gps_columns
 
 class TestDetectGPSColumns(unittest.TestCase):
     def test_detect_gps_columns(self):
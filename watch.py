@@ -0,0 +1,211 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import load_config
+from engine import list_targets, parse_job, run_job, target_output_folder
+from instrument import configure
+
+WORKBOOK_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+SETTLE_SECONDS = 2.0
+POLL_INTERVAL = 1.0
+QUEUE_SIZE = 20
+WORKERS = 2
+
+
+def job_profile(config, name):
+    # Profiles use the --job file format, plus optional "sheets"/"all_sheets".
+    profiles = config.get('job_profiles') or {}
+    if name not in profiles:
+        raise ValueError(f"Unknown job profile: {name}")
+    spec = profiles[name]
+    return parse_job(spec), spec.get('sheets'), bool(spec.get('all_sheets', False))
+
+def scan_folder(folder):
+    signatures = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            # Excel keeps "~$" lock files next to open workbooks.
+            if entry.name.startswith(('~$', '.')) or not entry.name.lower().endswith(WORKBOOK_EXTENSIONS):
+                continue
+            if entry.is_file():
+                stat = entry.stat()
+                signatures[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return signatures
+
+def _warm_up():
+    # Importing this module in a worker already pulls in pandas, matplotlib,
+    # folium and reportlab through engine.
+    return os.getpid()
+
+
+class FolderWatcher:
+    # Polls a folder and runs the job on every new or changed workbook once its
+    # size and mtime have been stable for `settle_seconds`, so half-copied
+    # files are never opened. At most `queue_size` targets are handed to the
+    # pool at a time, the rest wait in `pending` until a slot frees up.
+    def __init__(self, folder, job, config, output_folder, sheets=None, all_sheets=False,
+                 settle_seconds=SETTLE_SECONDS, queue_size=QUEUE_SIZE, workers=WORKERS,
+                 executor=None, clock=time.monotonic, on_result=None):
+        self.folder = folder
+        self.job = job
+        self.config = config
+        self.output_folder = output_folder
+        self.sheets = sheets
+        self.all_sheets = all_sheets
+        self.settle_seconds = settle_seconds
+        self.queue_size = queue_size
+        self.workers = workers
+        self.executor = executor
+        self.clock = clock
+        self.on_result = on_result
+        self.pending = {}
+        self.processed = {}
+        self.running = {}
+
+    def start(self, process_existing=False):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            # Start every worker now rather than on the first dropped file.
+            for future in [self.executor.submit(_warm_up) for _ in range(self.workers)]:
+                future.result()
+        if not process_existing:
+            self.processed.update(scan_folder(self.folder))
+        logging.info("Watching %s (%s workers)", self.folder, self.workers)
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def poll(self):
+        results = self.collect()
+        now = self.clock()
+        signatures = scan_folder(self.folder)
+        running_paths = {path for path, _, _, _ in self.running.values()}
+        for path in list(self.pending):
+            if path not in signatures:
+                del self.pending[path]
+        for path, signature in signatures.items():
+            if self.processed.get(path) == signature:
+                continue
+            previous = self.pending.get(path)
+            if previous is None or previous[0] != signature:
+                # Any change restarts the settle delay.
+                self.pending[path] = (signature, now)
+        ready = sorted((changed, path) for path, (_, changed) in self.pending.items()
+                       if now - changed >= self.settle_seconds and path not in running_paths)
+        for _, path in ready:
+            if len(self.running) >= self.queue_size:
+                logging.warning("Queue full, %s waiting", path)
+                break
+            self.dispatch(path, now)
+        return results
+
+    def dispatch(self, path, now):
+        signature, changed = self.pending.pop(path)
+        try:
+            targets = list_targets([path], self.sheets, self.all_sheets, self.config)
+        except Exception as e:
+            # Retried when the file changes again.
+            self.processed[path] = signature
+            logging.error("Error opening %s: %s", path, e)
+            return
+        if not targets:
+            logging.warning("No matching sheet in %s", path)
+        submitted = {}
+        try:
+            for workbook, sheet in targets:
+                folder = target_output_folder(self.output_folder, workbook, sheet)
+                future = self.executor.submit(run_job, workbook, sheet, self.job, self.config, folder, chart_workers=1)
+                submitted[future] = (path, sheet, folder, now)
+        except Exception as e:
+            # Nothing is queued, the workbook stays pending for the next poll.
+            for future in submitted:
+                future.cancel()
+            self.pending[path] = (signature, changed)
+            logging.error("Could not queue %s: %s", path, e)
+            return
+        self.processed[path] = signature
+        self.running.update(submitted)
+        for _, sheet, _, _ in submitted.values():
+            logging.info("Queued %s (sheet %s)", path, sheet)
+
+    def collect(self):
+        results = []
+        for future in [future for future in self.running if future.done()]:
+            path, sheet, folder, queued_at = self.running.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error("Worker failed for %s (sheet %s): %s", path, sheet, e)
+                result = {"workbook": path, "sheet": sheet, "output_folder": folder, "charts": [], "pdf": None,
+                          "map": None, "errors": [{"stage": "worker", "message": str(e)}], "ok": False}
+            elapsed = self.clock() - queued_at
+            if result["ok"]:
+                logging.info("Report ready for %s (sheet %s) in %.1fs: %s", path, sheet, elapsed, folder)
+            else:
+                logging.error("Report failed for %s (sheet %s): %s", path, sheet, result["errors"])
+            if self.on_result:
+                self.on_result(result)
+            results.append(result)
+        return results
+
+    def run(self, poll_interval=POLL_INTERVAL, stop=None):
+        stop = stop or threading.Event()
+        try:
+            while not stop.is_set():
+                self.poll()
+                stop.wait(poll_interval)
+        finally:
+            self.stop()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="linkgraph-watch", description="Watch a folder and generate Linkgraph reports for every new or changed workbook.")
+    parser.add_argument("folder", nargs="?", default=None, help="folder to watch (defaults to watch_folder from config.json)")
+    parser.add_argument("--job-profile", default=None, help="job profile from job_profiles in config.json (defaults to watch_profile)")
+    parser.add_argument("--output", default=None, help="output folder (defaults to output_folder from config.json)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--process-existing", action="store_true", help="also process the workbooks already in the folder")
+    parser.add_argument("--config", default=None, help="path to config.json")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+    config = load_config(args.config)
+    if not config:
+        logging.error("Configuration not loaded.")
+        return 2
+    folder = args.folder or config.get('watch_folder')
+    if not folder or not os.path.isdir(folder):
+        logging.error("Watch folder not found: %s", folder)
+        return 2
+    try:
+        job, sheets, all_sheets = job_profile(config, args.job_profile or config.get('watch_profile'))
+    except Exception as e:
+        logging.error("Invalid job profile: %s", e)
+        return 2
+
+    configure(config.get('spans_file'))
+    watcher = FolderWatcher(folder, job, config, args.output or config.get('output_folder', '.'), sheets, all_sheets,
+                            settle_seconds=config.get('watch_settle_seconds', SETTLE_SECONDS),
+                            queue_size=config.get('watch_queue_size', QUEUE_SIZE),
+                            workers=args.workers or config.get('watch_workers', WORKERS))
+    watcher.start(args.process_existing)
+    try:
+        watcher.run(config.get('watch_poll_interval', POLL_INTERVAL))
+    except KeyboardInterrupt:
+        logging.info("Watcher stopped")
+    return 0
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())